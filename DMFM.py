@@ -1,21 +1,31 @@
 import streamlit as st
 import os
 import base64
+import math
 from pathlib import Path
 from datetime import datetime, date
+import pandas as pd
 from dotenv import load_dotenv
-from supabase import create_client, Client
 
-from utils.data_processing import calculate_portfolio_metrics, prepare_closed_positions_stats, get_market_price
-from utils.ui_components import render_header, render_portfolio_table, render_closed_stats, render_closed_table
+from utils.data_processing import calculate_portfolio_metrics, prepare_closed_positions_stats, get_market_price, invalidate_prices, price_snapshot_version
+from utils.ui_components import render_header, render_portfolio_table, build_portfolio_table_html, build_closed_stats_html, build_closed_table_html, render_perf_panel
+from utils.resilience import degraded_sources, get_resilience_status
+from utils.session_store import apply_upsert, apply_delete, replace_rows, get_version
+from utils.market_calendar import is_trading_session, next_session_open, vn_now, describe_price_cache_policy
+from utils.metrics_engine import portfolio_frame, portfolio_totals
+from utils.data_access import (
+    load_all_tabs, load_portfolio, load_closed, save_portfolio_item, update_portfolio_item, delete_portfolio_item,
+    sell_portfolio_item, delete_closed_items, export_prometheus,
+)
+from utils.perf_trace import start_run, finish_run, span
 
 # ============================================================
-# TẢI BIẾN MÔI TRƯỜNG & KHỞI TẠO SUPABASE
+# TẢI BIẾN MÔI TRƯỜNG
 # ============================================================
 load_dotenv()
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Trace thời gian của lần chạy script này (utils/perf_trace.py); giữ trong session để
+# luồng lấy giá ghi được vào, kết thúc và ghi log ở cuối file
+st.session_state["_perf_trace"] = _perf_trace = start_run()
 
 # ============================================================
 # CẤU HÌNH TRANG
@@ -29,421 +39,356 @@ st.set_page_config(
 # ============================================================
 # CSS GIAO DIỆN DARK THEME + GLASSMORPHISM
 # ============================================================
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800;900&display=swap');
-
-    /* ===== ANIMATIONS ===== */
-    @keyframes fadeInUp {
-        from { opacity: 0; transform: translateY(16px); }
-        to   { opacity: 1; transform: translateY(0); }
-    }
-    @keyframes shimmer {
-        0%   { background-position: -200% 0; }
-        100% { background-position: 200% 0; }
-    }
-
-    /* ===== TOÀN BỘ TRANG ===== */
-    .stApp {
-        background: #ffffff !important;
-        font-family: 'Inter', sans-serif;
-    }
-
-    /* ===== HEADER ===== */
-    .main-header {
-        text-align: center;
-        padding: 5px 0 20px 0;
-        animation: fadeInUp 0.5s ease-out;
-        position: relative;
-    }
-    .main-header .logo-img {
-        position: absolute;
-        left: 0;
-        top: -15px;
-        height: 170px;
-    }
-    .main-header h1 {
-        font-size: 1.8rem;
-        font-weight: 900;
-        background: linear-gradient(135deg, #00897B 0%, #26A69A 40%, #4DB6AC 70%, #00897B 100%);
-        background-size: 200% auto;
-        animation: shimmer 4s linear infinite;
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        letter-spacing: 1.5px;
-        margin: 0;
-    }
-    .main-header .sub {
-        color: #78909C;
-        font-size: 0.82rem;
-        font-weight: 500;
-        letter-spacing: 2.5px;
-        text-transform: uppercase;
-        margin-top: 6px;
-    }
-    .main-header .divider {
-        width: 60px;
-        height: 3px;
-        background: linear-gradient(90deg, transparent, #00897B, transparent);
-        margin: 12px auto 0;
-        border-radius: 2px;
-    }
-
-    /* ===== TABLE CARD (chứa bảng) ===== */
-    .glass-card {
-        background: white;
-        border: 1px solid #e0e0e0;
-        border-radius: 16px;
-        padding: 0;
-        margin-bottom: 20px;
-        box-shadow: 0 2px 12px rgba(0,0,0,0.06);
-        overflow: hidden;
-        animation: fadeInUp 0.6s ease-out;
-    }
-
-    /* ===== CSS TABS STREAMLIT ===== */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 12px;
-        background-color: transparent;
-    }
-    .stTabs [data-baseweb="tab"] {
-        background-color: white !important;
-        border: 1px solid #e0e0e0;
-        border-radius: 8px 8px 0 0;
-        padding: 10px 24px;
-        color: #78909C;
-        font-weight: 600;
-        font-size: 0.95rem;
-        box-shadow: 0 -2px 5px rgba(0,0,0,0.02);
-        transition: all 0.2s ease-in-out;
-    }
-    .stTabs [data-baseweb="tab"]:hover {
-        color: #00897B;
-        background-color: #f9fdf9 !important;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #e8f5e9 !important;
-        color: #00897B !important;
-        border-bottom-color: #00897B !important;
-        border-bottom-width: 3px !important;
-    }
-
-    /* ===== KPI CARDS ===== */
-    .kpi-row {
-        display: grid;
-        grid-template-columns: repeat(4, 1fr);
-        gap: 16px;
-        margin-bottom: 30px;
-        margin-top: 15px;
-        animation: fadeInUp 0.5s ease-out;
-    }
-    .kpi-card {
-        background: linear-gradient(145deg, #00897B 0%, #00796B 100%);
-        border: none;
-        border-radius: 12px;
-        padding: 20px 18px 16px;
-        text-align: center;
-        position: relative;
-        overflow: hidden;
-        transition: all 0.35s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 4px 16px rgba(0,137,123,0.25);
-    }
-    .kpi-card::before {
-        content: '';
-        position: absolute;
-        top: 0; left: 0; right: 0;
-        height: 3px;
-        background: linear-gradient(90deg, transparent, rgba(255,255,255,0.5), transparent);
-    }
-    .kpi-card:hover {
-        transform: translateY(-4px);
-        box-shadow: 0 8px 30px rgba(0,137,123,0.35);
-    }
-    .kpi-card .kpi-title-row {
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        gap: 8px;
-        margin-bottom: 10px;
-    }
-    .kpi-card .kpi-icon {
-        font-size: 1.1rem;
-        line-height: 1;
-    }
-    .kpi-card .label {
-        color: rgba(255,255,255,0.9);
-        font-size: 1rem;
-        font-weight: 700;
-        letter-spacing: 0.5px;
-    }
-    .kpi-card .value {
-        font-size: 1.6rem;
-        font-weight: 800;
-        line-height: 1;
-    }
-    .kpi-card .value.positive { color: #B9F6CA; }
-    .kpi-card .value.negative { color: #FF8A80; }
-    .kpi-card .value.neutral  { color: #ffffff; }
-
-    /* ===== BẢNG DỮ LIỆU ===== */
-    .portfolio-table {
-        width: 100%;
-        border-collapse: collapse;
-    }
-    .portfolio-table thead th {
-        background: #00796B;
-        color: #ffffff;
-        font-weight: 700;
-        font-size: 0.78rem;
-        text-transform: uppercase;
-        letter-spacing: 1.2px;
-        padding: 18px 16px;
-        text-align: center;
-        border-bottom: 2px solid #004D40;
-    }
-    .portfolio-table tbody td {
-        padding: 16px 16px;
-        color: #37474F;
-        font-size: 0.93rem;
-        text-align: center;
-        border-bottom: 1px solid #f0f0f0;
-        font-weight: 500;
-    }
-    .portfolio-table tbody tr {
-        transition: background 0.2s;
-    }
-    .portfolio-table tbody tr:nth-child(even) {
-        background: #f9fdf9;
-    }
-    .portfolio-table tbody tr:hover {
-        background: #e8f5e9;
-    }
-    .portfolio-table .symbol {
-        font-weight: 800;
-        color: #00897B;
-        font-size: 1.05rem;
-        letter-spacing: 0.5px;
-    }
-    .portfolio-table .profit-positive {
-        color: #2E7D32;
-        font-weight: 800;
-    }
-    .portfolio-table .profit-negative {
-        color: #D32F2F;
-        font-weight: 800;
-    }
-
-    /* ===== SIDEBAR ===== */
-    section[data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #00897B 0%, #00796B 100%) !important;
-        border-right: none;
-    }
-    section[data-testid="stSidebar"] .stMarkdown h2 {
-        color: white;
-        font-weight: 700;
-        font-size: 1rem;
-        letter-spacing: 0.5px;
-    }
-    section[data-testid="stSidebar"] label {
-        color: rgba(255,255,255,0.85) !important;
-        font-size: 0.82rem !important;
-        font-weight: 500 !important;
-    }
-    section[data-testid="stSidebar"] p,
-    section[data-testid="stSidebar"] span {
-        color: rgba(255,255,255,0.9) !important;
-    }
-
-    /* ===== FORM INPUTS ===== */
-    .stNumberInput input, .stTextInput input, .stDateInput input {
-        background: white !important;
-        border: 1px solid #e0e0e0 !important;
-        border-radius: 10px !important;
-        color: #37474F !important;
-        font-weight: 500 !important;
-    }
-    .stNumberInput input:focus, .stTextInput input:focus, .stDateInput input:focus {
-        border-color: #00897B !important;
-        box-shadow: 0 0 8px rgba(0,137,123,0.15) !important;
-    }
-
-    /* ===== NÚT BẤM ===== */
-    .stButton > button {
-        background: linear-gradient(135deg, #00897B 0%, #26A69A 100%);
-        color: white;
-        border: none;
-        border-radius: 8px;
-        padding: 12px 24px;
-        font-weight: 600;
-        font-size: 0.9rem;
-        letter-spacing: 0.5px;
-        transition: all 0.2s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 4px 6px rgba(0,137,123,0.2);
-    }
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 14px rgba(0,137,123,0.35);
-        background: linear-gradient(135deg, #00796B 0%, #00897B 100%);
-        color: white;
-    }
-
-    /* ===== TIMESTAMP ===== */
-    .timestamp {
-        text-align: center;
-        color: #90A4AE;
-        font-size: 0.75rem;
-        font-weight: 400;
-        letter-spacing: 0.5px;
-        margin-top: 20px;
-        padding-top: 16px;
-        border-top: 1px solid #e0e0e0;
-    }
-
-    /* ===== FORM STYLING ===== */
-    [data-testid="stForm"] {
-        background: #fafafa !important;
-        border: 1px solid #eeeeee !important;
-        border-radius: 12px !important;
-        padding: 24px !important;
-        margin-top: 10px;
-        box-shadow: 0 4px 10px rgba(0,0,0,0.02) !important;
-        transition: box-shadow 0.3s ease;
-    }
-    [data-testid="stForm"]:hover {
-        box-shadow: 0 8px 24px rgba(0,137,123,0.06) !important;
-    }
-    [data-testid="stForm"] label,
-    [data-testid="stForm"] .stMarkdown p {
-        color: #263238 !important;
-        font-weight: 500 !important;
-    }
-    [data-testid="stForm"] h3, 
-    [data-testid="stForm"] h4,
-    [data-testid="stForm"] h2 {
-        color: #00796B !important;
-    }
-
-    /* Ẩn hamburger menu & footer mặc định */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-
-    /* Loại bỏ khoảng trắng thừa của thanh tab */
-    .stTabs {
-        margin-top: -10px;
-    }
-
-    /* ===== RESPONSIVE DESIGN (Điện thoại & Tablet) ===== */
-    @media (max-width: 992px) {
-        .kpi-row {
-            grid-template-columns: repeat(2, 1fr);
-        }
-    }
-    
-    @media (max-width: 768px) {
-        .main-header h1 {
-            font-size: 1.5rem;
-        }
-        .main-header .sub {
-            font-size: 0.75rem;
-        }
-        .main-header .logo-img {
-            position: relative;
-            height: 120px;
-            display: block;
-            margin: 0 auto 12px;
-        }
-        .kpi-row {
-            grid-template-columns: 1fr;
-        }
-        .portfolio-table {
-            display: block;
-            overflow-x: auto;
-            white-space: nowrap;
-        }
-        .portfolio-table thead th, .portfolio-table tbody td {
-            padding: 10px;
-            font-size: 0.85rem;
-        }
-        .stButton > button {
-            padding: 8px 16px;
-            font-size: 0.8rem;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+# CSS nằm ở static/style.css, phục vụ qua static file serving của Streamlit
+# (.streamlit/config.toml) nên trình duyệt cache lại, mỗi lần chạy chỉ gửi 1 dòng @import
+st.markdown('<style>@import url("app/static/style.css");</style>', unsafe_allow_html=True)
 
 # ============================================================
-# DỮ LIỆU - LƯU/ĐỌC SUPABASE
+# TÀI KHOẢN
 # ============================================================
+# Đọc/ghi Supabase nằm ở utils/data_access.py (có đo số request, độ trễ, số dòng, lỗi)
 
-def load_portfolio(tab_id="tab1"):
-    """Đọc danh mục từ bảng portfolio trên Supabase."""
-    try:
-        response = supabase.table("portfolio").select("*").eq("tab_id", tab_id).execute()
-        return response.data
-    except Exception as e:
-        st.error(f"Lỗi đọc Supabase: {e}")
-        return []
+# tab_id -> (nhãn trên thanh chọn tài khoản, tên tài khoản)
+ACCOUNTS = {
+    "tab1": ("📑 Danh mục Tổng", "Tài khoản 1 (Đuôi 1)"),
+    "tab2": ("📑 Danh mục Margin", "Tài khoản 6 (Margin)"),
+}
+TAB_IDS = list(ACCOUNTS)
 
-def save_portfolio_item(data, tab_id="tab1"):
-    """Thêm 1 record vào bảng portfolio trên Supabase."""
-    data["tab_id"] = tab_id
-    supabase.table("portfolio").insert(data).execute()
 
-def update_portfolio_item(item_id, data):
-    """Cập nhật 1 record trong bảng portfolio."""
-    supabase.table("portfolio").update(data).eq("id", item_id).execute()
+# ============================================================
+# SESSION STATE KHỞI TẠO MẶC ĐỊNH
+# ============================================================
+_tabs_to_load = [
+    t for t in TAB_IDS
+    if f"portfolio_{t}" not in st.session_state or f"closed_positions_{t}" not in st.session_state
+]
+if _tabs_to_load:
+    with span("bootstrap.load_all_tabs"):
+        _portfolios, _closed = load_all_tabs(_tabs_to_load)
+    for t in _tabs_to_load:
+        st.session_state.setdefault(f"portfolio_{t}", _portfolios[t])
+        st.session_state.setdefault(f"closed_positions_{t}", _closed[t])
 
-def delete_portfolio_item(item_id):
-    """Xóa 1 record trong bảng portfolio."""
-    supabase.table("portfolio").delete().eq("id", item_id).execute()
 
 # ============================================================
-# DỮ LIỆU - VỊ THẾ ĐÃ ĐÓNG (Chốt lời / Cắt lỗ)
+# BẢNG GIÁ TỰ CẬP NHẬT TRONG PHIÊN (LIVE)
 # ============================================================
+LIVE_REFRESH_SECONDS = 30
+
+def _live_portfolio_table(tab_id: str, polling: bool):
+    """Bảng danh mục tự lấy lại giá mỗi LIVE_REFRESH_SECONDS giây, chỉ rerun fragment này.
 
-def load_closed(tab_id="tab1"):
-    """Đọc danh sách vị thế đã đóng từ Supabase."""
-    try:
-        response = supabase.table("closed_positions").select("*").eq("tab_id", tab_id).execute()
-        return response.data
-    except Exception as e:
-        st.error(f"Lỗi đọc Supabase: {e}")
-        return []
+    Dùng danh mục đang có trong session (không đọc lại Supabase).
+    """
+    if polling != is_trading_session():
+        # Hết phiên / tới giờ mở phiên: rerun cả trang để tạo lại fragment với run_every mới
+        st.rerun()
+    rows = calculate_portfolio_metrics(st.session_state[f"portfolio_{tab_id}"])
+    render_portfolio_table(rows, tab_id)
+    if polling:
+        st.caption(f"📡 Giá tự động cập nhật mỗi {LIVE_REFRESH_SECONDS} giây trong phiên giao dịch")
+    else:
+        resume_at = next_session_open().strftime("%H:%M %d/%m")
+        st.caption(f"⏸️ Ngoài giờ giao dịch — tạm dừng tự động cập nhật giá, tiếp tục lúc {resume_at}")
+
+def render_live_portfolio_table(tab_id: str):
+    """Bảng danh mục chế độ live: chỉ polling khi đang trong phiên giao dịch HOSE.
+
+    Ngoài phiên, fragment chỉ hẹn 1 lần chạy lại đúng lúc mở phiên kế tiếp (nghỉ trưa,
+    qua đêm, cuối tuần) để màn hình treo tường tự polling lại mà không cần tải lại trang.
+    """
+    polling = is_trading_session()
+    if polling:
+        run_every = LIVE_REFRESH_SECONDS
+    else:
+        # +1 giây để lúc thức dậy chắc chắn đã vào phiên
+        run_every = math.ceil((next_session_open() - vn_now()).total_seconds()) + 1
+    live_table = st.fragment(_live_portfolio_table, run_every=run_every)
+    live_table(tab_id, polling)
 
-def save_closed_item(data, tab_id="tab1"):
-    """Thêm 1 record vào bảng closed_positions trên Supabase."""
-    data["tab_id"] = tab_id
-    supabase.table("closed_positions").insert(data).execute()
 
-def delete_closed_item(item_id):
-    """Xóa 1 record trong bảng closed_positions."""
-    supabase.table("closed_positions").delete().eq("id", item_id).execute()
+# ============================================================
+# LƯỚI CHỌN VỊ THẾ + SỬA / BÁN / XÓA
+# ============================================================
+def _portfolio_grid_frame(curr_portfolio, tab_id):
+    """DataFrame hiển thị trong lưới chọn vị thế (1 dòng / vị thế, cùng thứ tự session)."""
+    frame = pd.DataFrame.from_records(
+        curr_portfolio, columns=["ma_cp", "ngay_mua", "gia_von", "ngay_mua_2", "gia_von_2", "ty_trong"]
+    )
+    frame["ngay_mua"] = pd.to_datetime(frame["ngay_mua"])
+    frame["ngay_mua_2"] = pd.to_datetime(frame["ngay_mua_2"])
+    if tab_id != "tab1":
+        frame = frame.drop(columns="ty_trong")
+    return frame
+
+
+PORTFOLIO_GRID_COLUMNS = {
+    "ma_cp": st.column_config.TextColumn("Mã CP"),
+    "ngay_mua": st.column_config.DateColumn("Ngày mua 1", format="DD/MM/YYYY"),
+    "gia_von": st.column_config.NumberColumn("Giá vốn 1 (₫)", format="localized"),
+    "ngay_mua_2": st.column_config.DateColumn("Ngày mua 2", format="DD/MM/YYYY"),
+    "gia_von_2": st.column_config.NumberColumn("Giá vốn 2 (₫)", format="localized"),
+    "ty_trong": st.column_config.NumberColumn("Tỷ trọng", format="%g%%"),
+}
+
+
+@st.fragment
+def render_position_actions(tab_id: str):
+    """Lưới chọn vị thế (st.dataframe, dữ liệu Arrow) và các nút Sửa / Bán / Xóa cho dòng đang chọn.
+
+    Cả khu vực là 1 fragment: chọn dòng, mở / hủy form chỉ rerun fragment này; chỉ khi đã
+    ghi dữ liệu mới rerun toàn bộ trang để tính lại bảng danh mục. Số widget không phụ thuộc
+    số vị thế.
+    """
+    k_pfx = tab_id
+    portfolio_key = f"portfolio_{tab_id}"
+    curr_portfolio = st.session_state[portfolio_key]
+    if not curr_portfolio:
+        return
+    # Form đang mở: {"mode": "edit" / "sell", "id": id vị thế}
+    mode_key = f"action_{tab_id}"
+
+    # Key lưới gắn với phiên bản danh mục: sau khi thêm / sửa / bán / xóa, lựa chọn cũ
+    # (theo vị trí dòng) được bỏ thay vì trỏ nhầm sang vị thế khác
+    event = st.dataframe(
+        _portfolio_grid_frame(curr_portfolio, tab_id),
+        column_config=PORTFOLIO_GRID_COLUMNS,
+        hide_index=True,
+        width="stretch",
+        height=min(400, 38 + 35 * len(curr_portfolio)),
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"grid_{k_pfx}_{get_version(portfolio_key)}",
+    )
+    selected = event.selection.rows
+    item = curr_portfolio[selected[0]] if selected else None
+
+    col_name, col_edit, col_sell, col_del = st.columns([3, 1, 1, 1])
+    with col_name:
+        if item is None:
+            label = "Chọn 1 cổ phiếu trong bảng để sửa / bán / xóa"
+        else:
+            ty_trong_text = f" — tỷ trọng {item['ty_trong']}%" if tab_id == "tab1" else ""
+            label = f'{selected[0]+1}. {item["ma_cp"]}{ty_trong_text}'
+        st.markdown(f'<span style="color:#78909C;font-size:0.85rem;">{label}</span>', unsafe_allow_html=True)
+    with col_edit:
+        if st.button("✏️ Sửa", key=f"edit_{k_pfx}", disabled=item is None, use_container_width=True):
+            st.session_state[mode_key] = {"mode": "edit", "id": item["id"]}
+    with col_sell:
+        if st.button("💰 Bán", key=f"sell_{k_pfx}", disabled=item is None, use_container_width=True):
+            st.session_state[mode_key] = {"mode": "sell", "id": item["id"]}
+    with col_del:
+        if st.button("🗑️ Xóa", key=f"del_{k_pfx}", disabled=item is None, use_container_width=True):
+            deleted = delete_portfolio_item(item["id"])
+            apply_delete(portfolio_key, deleted, lambda: load_portfolio(tab_id))
+            st.session_state.pop(mode_key, None)
+            st.toast(f"Đã xóa **{item['ma_cp']}**", icon="🗑️")
+            st.rerun()
+
+    # Form chỉ hiện khi vẫn đang chọn đúng vị thế đã bấm Sửa / Bán
+    action = st.session_state.get(mode_key)
+    if item is None or not action or action["id"] != item["id"]:
+        return
+    if action["mode"] == "sell":
+        _render_sell_form(tab_id, item, mode_key)
+    elif action["mode"] == "edit":
+        _render_edit_form(tab_id, item, mode_key)
 
 
+def _render_sell_form(tab_id: str, item: dict, mode_key: str):
+    """Form bán 1 cổ phiếu (chốt lời / cắt lỗ)."""
+    k_pfx = tab_id
+    portfolio_key = f"portfolio_{tab_id}"
+    closed_key = f"closed_positions_{tab_id}"
+    with st.form(f"sell_form_{k_pfx}_{item['id']}"):
+        st.markdown(
+            f'<span style="color:#FF6F00;font-weight:600;">💰 Bán {item["ma_cp"]}</span>',
+            unsafe_allow_html=True,
+        )
+        sc1, sc2 = st.columns(2)
+        with sc1:
+            sell_date = st.date_input("Ngày bán", value=date.today(), format="DD/MM/YYYY", key=f"sdate_{k_pfx}_{item['id']}")
+        with sc2:
+            sell_price = st.number_input("Giá bán (₫)", min_value=0, step=1000, value=0, key=f"sprice_{k_pfx}_{item['id']}")
+        sb1, sb2 = st.columns(2)
+        with sb1:
+            confirm_sell = st.form_submit_button("✅ Xác nhận bán", use_container_width=True)
+        with sb2:
+            cancel_sell = st.form_submit_button("↩️ Hủy", use_container_width=True)
+
+        if confirm_sell and sell_price > 0:
+            gia_von_avg = item["gia_von"]
+            if item.get("gia_von_2"):
+                gia_von_avg = (item["gia_von"] + item["gia_von_2"]) / 2
+            profit_pct = (sell_price - gia_von_avg) / gia_von_avg * 100
+
+            closed_entry = {
+                "ma_cp": item["ma_cp"],
+                "ngay_mua": item["ngay_mua"],
+                "gia_von": item["gia_von"],
+                "ty_trong": item["ty_trong"],
+                "ngay_ban": sell_date.strftime("%Y-%m-%d"),
+                "gia_ban": sell_price,
+                "profit_pct": profit_pct,
+                "loai": "chot_loi" if profit_pct >= 0 else "cat_lo",
+            }
+            if item.get("ngay_mua_2"):
+                closed_entry["ngay_mua_2"] = item["ngay_mua_2"]
+                closed_entry["gia_von_2"] = item["gia_von_2"]
 
+            try:
+                result = sell_portfolio_item(item["id"], closed_entry)
+            except Exception as e:
+                # Không ghi gì cả (transaction bị hủy) -> đồng bộ lại với Supabase
+                st.error(f"Lỗi bán {item['ma_cp']}: {e}")
+                replace_rows(portfolio_key, load_portfolio(tab_id))
+                replace_rows(closed_key, load_closed(tab_id))
+                st.session_state[mode_key] = None
+            else:
+                replace_rows(portfolio_key, result["portfolio"])
+                replace_rows(closed_key, result["closed"])
+                st.session_state[mode_key] = None
+                label = "Chốt lời" if profit_pct >= 0 else "Cắt lỗ"
+                st.toast(f"{label} **{item['ma_cp']}** ({profit_pct:+.2f}%)", icon="💰")
+                st.rerun()
 
-# ============================================================
-# SESSION STATE KHỞI TẠO MẶC ĐỊNH
-# ============================================================
-if "portfolio_tab1" not in st.session_state:
-    st.session_state.portfolio_tab1 = load_portfolio("tab1")
-if "closed_positions_tab1" not in st.session_state:
-    st.session_state.closed_positions_tab1 = load_closed("tab1")
-if "editing_idx_tab1" not in st.session_state:
-    st.session_state.editing_idx_tab1 = None
-if "selling_idx_tab1" not in st.session_state:
-    st.session_state.selling_idx_tab1 = None
-
-if "portfolio_tab2" not in st.session_state:
-    st.session_state.portfolio_tab2 = load_portfolio("tab2")
-if "closed_positions_tab2" not in st.session_state:
-    st.session_state.closed_positions_tab2 = load_closed("tab2")
-if "editing_idx_tab2" not in st.session_state:
-    st.session_state.editing_idx_tab2 = None
-if "selling_idx_tab2" not in st.session_state:
-    st.session_state.selling_idx_tab2 = None
+        if cancel_sell:
+            st.session_state[mode_key] = None
+            st.rerun(scope="fragment")
+
+
+def _render_edit_form(tab_id: str, item: dict, mode_key: str):
+    """Form chỉnh sửa inline 1 cổ phiếu."""
+    k_pfx = tab_id
+    portfolio_key = f"portfolio_{tab_id}"
+    with st.form(f"edit_form_{k_pfx}_{item['id']}"):
+        st.markdown(
+            f'<span style="color:#00897B;font-weight:600;">Chỉnh sửa {item["ma_cp"]}</span>',
+            unsafe_allow_html=True,
+        )
+        st.markdown("**Lần mua 1**")
+        ec1, ec2, ec3 = st.columns(3)
+        with ec1:
+            edit_date = st.date_input(
+                "Ngày mua 1",
+                value=datetime.strptime(item["ngay_mua"], "%Y-%m-%d").date(),
+                format="DD/MM/YYYY",
+                key=f"edate_{k_pfx}_{item['id']}",
+            )
+        with ec2:
+            edit_price = st.number_input(
+                "Giá vốn 1 (₫)", min_value=0, step=1000, value=int(item["gia_von"]),
+                key=f"eprice_{k_pfx}_{item['id']}",
+            )
+        with ec3:
+            edit_weight = st.number_input(
+                "Tỷ trọng (%)", min_value=0, max_value=100, step=5, value=int(item["ty_trong"]),
+                key=f"eweight_{k_pfx}_{item['id']}",
+            )
+
+        has_buy2 = bool(item.get("ngay_mua_2"))
+        st.markdown("**Lần mua 2** *(tuỳ chọn)*")
+        ed2_1, ed2_2 = st.columns(2)
+        with ed2_1:
+            edit_date_2 = st.date_input(
+                "Ngày mua 2",
+                value=datetime.strptime(item["ngay_mua_2"], "%Y-%m-%d").date() if has_buy2 else date.today(),
+                format="DD/MM/YYYY",
+                key=f"edate2_{k_pfx}_{item['id']}",
+            )
+        with ed2_2:
+            edit_price_2 = st.number_input(
+                "Giá vốn 2 (₫)", min_value=0, step=1000,
+                value=int(item["gia_von_2"]) if has_buy2 else 0,
+                key=f"eprice2_{k_pfx}_{item['id']}",
+            )
+
+        fc1, fc2, fc3 = st.columns(3)
+        with fc1:
+            save_btn = st.form_submit_button("✅ Lưu lại", use_container_width=True)
+        with fc2:
+            cancel_btn = st.form_submit_button("↩️ Hủy", use_container_width=True)
+
+        if has_buy2:
+            with fc3:
+                del_buy2_btn = st.form_submit_button("🗑️ Xóa lần mua 2", use_container_width=True)
+        else:
+            del_buy2_btn = False
+
+        if save_btn:
+            upd_data = {
+                "ngay_mua": edit_date.strftime("%Y-%m-%d"),
+                "gia_von": edit_price,
+                "ty_trong": edit_weight,
+            }
+            if edit_price_2 > 0:
+                upd_data["ngay_mua_2"] = edit_date_2.strftime("%Y-%m-%d")
+                upd_data["gia_von_2"] = edit_price_2
+            else:
+                upd_data["ngay_mua_2"] = None
+                upd_data["gia_von_2"] = None
+
+            updated = update_portfolio_item(item["id"], upd_data)
+            apply_upsert(portfolio_key, updated, lambda: load_portfolio(tab_id))
+            st.session_state[mode_key] = None
+            st.toast(f"Đã cập nhật **{item['ma_cp']}**", icon="✅")
+            st.rerun()
+        if cancel_btn:
+            st.session_state[mode_key] = None
+            st.rerun(scope="fragment")
+        if del_buy2_btn:
+            updated = update_portfolio_item(item["id"], {"ngay_mua_2": None, "gia_von_2": None})
+            apply_upsert(portfolio_key, updated, lambda: load_portfolio(tab_id))
+            st.session_state[mode_key] = None
+            st.toast(f"Đã xóa lần mua 2 của **{item['ma_cp']}**", icon="🗑️")
+            st.rerun()
+
+
+CLOSED_GRID_COLUMNS = {
+    "ma_cp": st.column_config.TextColumn("Mã CP"),
+    "ngay_mua": st.column_config.DateColumn("Ngày mua", format="DD/MM/YYYY"),
+    "ngay_ban": st.column_config.DateColumn("Ngày bán", format="DD/MM/YYYY"),
+    "gia_ban": st.column_config.NumberColumn("Giá bán (₫)", format="localized"),
+    "profit_pct": st.column_config.NumberColumn("% Lợi nhuận", format="%+.2f%%"),
+    "loai": st.column_config.TextColumn("Loại"),
+}
+
+
+@st.fragment
+def render_closed_actions(tab_id: str):
+    """Lưới chọn giao dịch đã đóng (chọn nhiều dòng) và nút xóa các giao dịch đã chọn."""
+    closed_key = f"closed_positions_{tab_id}"
+    curr_closed = st.session_state[closed_key]
+    if not curr_closed:
+        return
+
+    frame = pd.DataFrame.from_records(curr_closed, columns=list(CLOSED_GRID_COLUMNS))
+    frame["ngay_mua"] = pd.to_datetime(frame["ngay_mua"])
+    frame["ngay_ban"] = pd.to_datetime(frame["ngay_ban"])
+    frame["loai"] = frame["loai"].map({"chot_loi": "Chốt lời", "cat_lo": "Cắt lỗ"})
+
+    with st.expander("🗑️ Xóa giao dịch đã đóng", expanded=False):
+        event = st.dataframe(
+            frame,
+            column_config=CLOSED_GRID_COLUMNS,
+            hide_index=True,
+            width="stretch",
+            height=min(400, 38 + 35 * len(curr_closed)),
+            on_select="rerun",
+            selection_mode="multi-row",
+            key=f"closed_grid_{tab_id}_{get_version(closed_key)}",
+        )
+        selected = [curr_closed[i] for i in event.selection.rows]
+        if st.button(
+            f"🗑️ Xóa {len(selected)} giao dịch đã chọn",
+            key=f"del_closed_{tab_id}",
+            disabled=not selected,
+        ):
+            deleted = delete_closed_items([c["id"] for c in selected])
+            apply_delete(closed_key, deleted, lambda: load_closed(tab_id))
+            st.toast(f"Đã xóa {len(deleted)} giao dịch", icon="🗑️")
+            st.rerun()
 
 
 # ============================================================
@@ -457,23 +402,20 @@ def render_tab_content(tab_id: str, tab_title: str):
     # Tham chiếu data của tab hiện tại
     portfolio_key = f"portfolio_{tab_id}"
     closed_key = f"closed_positions_{tab_id}"
-    edit_key = f"editing_idx_{tab_id}"
-    sell_key = f"selling_idx_{tab_id}"
+    memo_key = f"memo_{tab_id}"
+    closed_memo_key = f"closed_memo_{tab_id}"
 
     curr_portfolio = st.session_state[portfolio_key]
     curr_closed = st.session_state[closed_key]
 
     # Nút trên cùng: Thêm CP + Cập nhật giá
     col_text, col_add, col_refresh = st.columns([2.5, 1, 1.2])
-    
+
     with col_text:
         # User wants Total Weight in Tab 1
         if tab_id == "tab1":
-            try:
-                total_weight = sum([float(item.get("ty_trong", 0)) for item in curr_portfolio])
-            except:
-                total_weight = 0
-            
+            total_weight = portfolio_totals(portfolio_frame(curr_portfolio, {}))["total_weight"]
+        
             st.markdown(
                 f'<div style="background-color: #e8f5e9; border: 1px dashed #4DB6AC; border-radius: 8px; padding: 10px 15px; margin-top: 5px; display: inline-block;">'
                 f'<span style="color: #00796B; font-weight: 700; font-size: 0.95rem;">📊 Tổng tỷ trọng: {total_weight}%</span>'
@@ -485,12 +427,14 @@ def render_tab_content(tab_id: str, tab_title: str):
         add_clicked = st.button("➕ Thêm cổ phiếu", key=f"add_btn_{k_pfx}", use_container_width=True)
     with col_refresh:
         refresh = st.button("🔄 Cập nhật giá thị trường", key=f"refresh_btn_{k_pfx}", use_container_width=True)
+        live = st.toggle("📡 Tự động cập nhật giá trong phiên", key=f"live_{k_pfx}")
 
     if refresh:
-        st.cache_data.clear()
+        invalidate_prices([item["ma_cp"] for item in curr_portfolio])
 
     # Thêm Header "Báo Cáo Danh Mục Đầu Tư" vào giữa nút và bảng
-    render_header(tab_id)
+    with span("tab.header"):
+        render_header(tab_id)
 
     @st.dialog(f"➕ Thêm cổ phiếu - {tab_title}")
     def add_stock_dialog():
@@ -526,8 +470,8 @@ def render_tab_content(tab_id: str, tab_title: str):
                 if buy_twice and new_price_2 > 0 and new_date_2:
                     entry["ngay_mua_2"] = new_date_2.strftime("%Y-%m-%d")
                     entry["gia_von_2"] = new_price_2
-                save_portfolio_item(entry, tab_id)
-                st.session_state[portfolio_key] = load_portfolio(tab_id)
+                inserted = save_portfolio_item(entry, tab_id)
+                apply_upsert(portfolio_key, inserted, lambda: load_portfolio(tab_id))
                 st.rerun()
 
     if add_clicked:
@@ -540,179 +484,52 @@ def render_tab_content(tab_id: str, tab_title: str):
         st.info("Danh mục trống. Hãy thêm cổ phiếu mới để bắt đầu!")
         return
 
-    with st.spinner("Đang lấy giá thị trường..."):
-        rows = calculate_portfolio_metrics(curr_portfolio)
+    if not live:
+        # Ghi nhớ chỉ số + HTML bảng theo (phiên bản danh mục, phiên bản ảnh chụp giá):
+        # rerun do bấm nút / mở form không làm đổi 2 phiên bản này nên không phải tính lại.
+        # Ảnh chụp giá chưa ổn định (thiếu giá / giá hết hạn) thì luôn tính lại.
+        symbols = [item["ma_cp"] for item in curr_portfolio]
+        data_version = get_version(portfolio_key)
+        price_version = price_snapshot_version(symbols)
+        memo = st.session_state.get(memo_key)
+        if (
+            memo is not None
+            and price_version is not None
+            and memo["key"] == (data_version, price_version)
+            and not any(r["price_stale"] for r in memo["rows"])
+        ):
+            table_html = memo["html"]
+        else:
+            with st.spinner("Đang lấy giá thị trường..."), span("tab.metrics"):
+                rows = calculate_portfolio_metrics(curr_portfolio)
+            with span("tab.table_html"):
+                table_html = build_portfolio_table_html(rows, tab_id)
+            # Đọc lại phiên bản giá sau khi tính vì các giá vừa tải đã được ghi vào cache
+            st.session_state[memo_key] = {
+                "key": (data_version, price_snapshot_version(symbols)),
+                "rows": rows,
+                "html": table_html,
+            }
+
+    # Cảnh báo khi nguồn vnstock đang bị ngắt mạch (giá hiển thị là giá gần nhất đã biết)
+    degraded = degraded_sources()
+    if degraded:
+        st.warning(f"⚠️ Nguồn dữ liệu vnstock đang gián đoạn ({', '.join(degraded)}). Đang hiển thị giá gần nhất đã biết.")
+        with st.expander("Trạng thái nguồn dữ liệu", expanded=False):
+            st.dataframe(get_resilience_status(), width="stretch", hide_index=True)
 
     # BẢNG DANH MỤC (HTML)
-    render_portfolio_table(rows, tab_id)
+    with span("tab.portfolio_table"):
+        if live:
+            render_live_portfolio_table(tab_id)
+        else:
+            st.markdown(table_html, unsafe_allow_html=True)
 
     # CHỈNH SỬA / XÓA TỪNG CỔ PHIẾU
     st.markdown("")  # spacer
 
-    for i, item in enumerate(curr_portfolio):
-        idx = i
-        col_name, col_edit, col_sell, col_del = st.columns([3, 1, 1, 1])
-        with col_name:
-            ngay = datetime.strptime(item["ngay_mua"], "%Y-%m-%d").strftime("%d/%m/%Y")
-            ty_trong_text = f" — tỷ trọng {item['ty_trong']}%" if tab_id == "tab1" else ""
-            st.markdown(
-                f'<span style="color:#78909C;font-size:0.85rem;">'
-                f'{idx+1}. {item["ma_cp"]}{ty_trong_text}</span>',
-                unsafe_allow_html=True,
-            )
-        with col_edit:
-            if st.button("✏️ Sửa", key=f"edit_{k_pfx}_{idx}", use_container_width=True):
-                st.session_state[edit_key] = idx
-                st.session_state[sell_key] = None
-        with col_sell:
-            if st.button("💰 Bán", key=f"sell_{k_pfx}_{idx}", use_container_width=True):
-                st.session_state[sell_key] = idx
-                st.session_state[edit_key] = None
-        with col_del:
-            if st.button("🗑️ Xóa", key=f"del_{k_pfx}_{idx}", use_container_width=True):
-                removed = item
-                delete_portfolio_item(item["id"])
-                st.session_state[portfolio_key] = load_portfolio(tab_id)
-                st.session_state[edit_key] = None
-                st.toast(f"Đã xóa **{removed['ma_cp']}**", icon="🗑️")
-                st.rerun()
-
-        # Form bán cổ phiếu (chốt lời / cắt lỗ)
-        if st.session_state.get(sell_key) == idx:
-            with st.form(f"sell_form_{k_pfx}_{idx}"):
-                st.markdown(
-                    f'<span style="color:#FF6F00;font-weight:600;">💰 Bán {item["ma_cp"]}</span>',
-                    unsafe_allow_html=True,
-                )
-                sc1, sc2 = st.columns(2)
-                with sc1:
-                    sell_date = st.date_input("Ngày bán", value=date.today(), format="DD/MM/YYYY", key=f"sdate_{k_pfx}_{idx}")
-                with sc2:
-                    sell_price = st.number_input("Giá bán (₫)", min_value=0, step=1000, value=0, key=f"sprice_{k_pfx}_{idx}")
-                sb1, sb2 = st.columns(2)
-                with sb1:
-                    confirm_sell = st.form_submit_button("✅ Xác nhận bán", use_container_width=True)
-                with sb2:
-                    cancel_sell = st.form_submit_button("↩️ Hủy", use_container_width=True)
-
-                if confirm_sell and sell_price > 0:
-                    gia_von_avg = item["gia_von"]
-                    if item.get("gia_von_2"):
-                        gia_von_avg = (item["gia_von"] + item["gia_von_2"]) / 2
-                    profit_pct = (sell_price - gia_von_avg) / gia_von_avg * 100
-
-                    closed_entry = {
-                        "ma_cp": item["ma_cp"],
-                        "ngay_mua": item["ngay_mua"],
-                        "gia_von": item["gia_von"],
-                        "ty_trong": item["ty_trong"],
-                        "ngay_ban": sell_date.strftime("%Y-%m-%d"),
-                        "gia_ban": sell_price,
-                        "profit_pct": profit_pct,
-                        "loai": "chot_loi" if profit_pct >= 0 else "cat_lo",
-                    }
-                    if item.get("ngay_mua_2"):
-                        closed_entry["ngay_mua_2"] = item["ngay_mua_2"]
-                        closed_entry["gia_von_2"] = item["gia_von_2"]
-
-                    save_closed_item(closed_entry, tab_id)
-                    delete_portfolio_item(item["id"])
-                    st.session_state[closed_key] = load_closed(tab_id)
-                    st.session_state[portfolio_key] = load_portfolio(tab_id)
-                    st.session_state[sell_key] = None
-                    label = "Chốt lời" if profit_pct >= 0 else "Cắt lỗ"
-                    st.toast(f"{label} **{item['ma_cp']}** ({profit_pct:+.2f}%)", icon="💰")
-                    st.rerun()
-
-                if cancel_sell:
-                    st.session_state[sell_key] = None
-                    st.rerun()
-
-        # Form chỉnh sửa inline
-        if st.session_state.get(edit_key) == idx:
-            with st.form(f"edit_form_{k_pfx}_{idx}"):
-                st.markdown(
-                    f'<span style="color:#00897B;font-weight:600;">Chỉnh sửa {item["ma_cp"]}</span>',
-                    unsafe_allow_html=True,
-                )
-                st.markdown("**Lần mua 1**")
-                ec1, ec2, ec3 = st.columns(3)
-                with ec1:
-                    edit_date = st.date_input(
-                        "Ngày mua 1",
-                        value=datetime.strptime(item["ngay_mua"], "%Y-%m-%d").date(),
-                        format="DD/MM/YYYY",
-                        key=f"edate_{k_pfx}_{idx}",
-                    )
-                with ec2:
-                    edit_price = st.number_input(
-                        "Giá vốn 1 (₫)", min_value=0, step=1000, value=int(item["gia_von"]),
-                        key=f"eprice_{k_pfx}_{idx}",
-                    )
-                with ec3:
-                    edit_weight = st.number_input(
-                        "Tỷ trọng (%)", min_value=0, max_value=100, step=5, value=int(item["ty_trong"]),
-                        key=f"eweight_{k_pfx}_{idx}",
-                    )
-
-                has_buy2 = bool(item.get("ngay_mua_2"))
-                st.markdown("**Lần mua 2** *(tuỳ chọn)*")
-                ed2_1, ed2_2 = st.columns(2)
-                with ed2_1:
-                    edit_date_2 = st.date_input(
-                        "Ngày mua 2",
-                        value=datetime.strptime(item["ngay_mua_2"], "%Y-%m-%d").date() if has_buy2 else date.today(),
-                        format="DD/MM/YYYY",
-                        key=f"edate2_{k_pfx}_{idx}",
-                    )
-                with ed2_2:
-                    edit_price_2 = st.number_input(
-                        "Giá vốn 2 (₫)", min_value=0, step=1000,
-                        value=int(item["gia_von_2"]) if has_buy2 else 0,
-                        key=f"eprice2_{k_pfx}_{idx}",
-                    )
-
-                fc1, fc2, fc3 = st.columns(3)
-                with fc1:
-                    save_btn = st.form_submit_button("✅ Lưu lại", use_container_width=True)
-                with fc2:
-                    cancel_btn = st.form_submit_button("↩️ Hủy", use_container_width=True)
-                
-                if has_buy2:
-                    with fc3:
-                        del_buy2_btn = st.form_submit_button("🗑️ Xóa lần mua 2", use_container_width=True)
-                else:
-                    del_buy2_btn = False
-
-                if save_btn:
-                    upd_data = {
-                        "ngay_mua": edit_date.strftime("%Y-%m-%d"),
-                        "gia_von": edit_price,
-                        "ty_trong": edit_weight,
-                    }
-                    if edit_price_2 > 0:
-                        upd_data["ngay_mua_2"] = edit_date_2.strftime("%Y-%m-%d")
-                        upd_data["gia_von_2"] = edit_price_2
-                    else:
-                        upd_data["ngay_mua_2"] = None
-                        upd_data["gia_von_2"] = None
-
-                    update_portfolio_item(item["id"], upd_data)
-                    st.session_state[portfolio_key] = load_portfolio(tab_id)
-                    st.session_state[edit_key] = None
-                    st.cache_data.clear()
-                    st.toast(f"Đã cập nhật **{item['ma_cp']}**", icon="✅")
-                    st.rerun()
-                if cancel_btn:
-                    st.session_state[edit_key] = None
-                    st.rerun()
-                if del_buy2_btn:
-                    update_portfolio_item(item["id"], {"ngay_mua_2": None, "gia_von_2": None})
-                    st.session_state[portfolio_key] = load_portfolio(tab_id)
-                    st.session_state[edit_key] = None
-                    st.cache_data.clear()
-                    st.toast(f"Đã xóa lần mua 2 của **{item['ma_cp']}**", icon="🗑️")
-                    st.rerun()
+    with span("tab.actions_grid"):
+        render_position_actions(tab_id)
 
     # ============================================================
     # THỐNG KÊ VỊ THẾ ĐÃ ĐÓNG (Chốt lời / Cắt lỗ)
@@ -721,47 +538,57 @@ def render_tab_content(tab_id: str, tab_title: str):
         st.markdown("---")
         st.markdown("### <span style='color:#00897B;'>📊 Lịch sử giao dịch đã đóng</span>", unsafe_allow_html=True)
 
-        # Thống kê tổng quan
-        stats = prepare_closed_positions_stats(curr_closed)
-        render_closed_stats(stats)
-
-        # Bảng chi tiết
-        render_closed_table(curr_closed)
-
-        # Nút xóa từng giao dịch đã đóng
-        for ci, c in enumerate(curr_closed):
-            cc_label, cc_btn = st.columns([4, 1])
-            with cc_label:
-                st.markdown(
-                    f'<span style="color:#78909C;font-size:0.85rem;">'
-                    f'{ci+1}. {c["ma_cp"]} — bán {datetime.strptime(c["ngay_ban"], "%Y-%m-%d").strftime("%d/%m/%Y")}</span>',
-                    unsafe_allow_html=True,
-                )
-            with cc_btn:
-                if st.button("🗑️ Xóa", key=f"del_closed_{k_pfx}_{ci}", use_container_width=True):
-                    delete_closed_item(c["id"])
-                    st.session_state[closed_key] = load_closed(tab_id)
-                    st.toast(f"Đã xóa giao dịch **{c['ma_cp']}**", icon="🗑️")
-                    st.rerun()
+        with span("tab.closed"):
+            # Thống kê tổng quan + bảng chi tiết chỉ phụ thuộc danh sách đã đóng (không phụ
+            # thuộc giá thị trường) nên ghi nhớ theo phiên bản danh sách
+            closed_version = get_version(closed_key)
+            closed_memo = st.session_state.get(closed_memo_key)
+            if closed_memo is None or closed_memo["key"] != closed_version:
+                stats = prepare_closed_positions_stats(curr_closed)
+                closed_memo = {
+                    "key": closed_version,
+                    "stats_html": build_closed_stats_html(stats),
+                    "table_html": build_closed_table_html(curr_closed),
+                }
+                st.session_state[closed_memo_key] = closed_memo
+            st.markdown(closed_memo["stats_html"], unsafe_allow_html=True)
+            st.markdown(closed_memo["table_html"], unsafe_allow_html=True)
+
+            render_closed_actions(tab_id)
 
     # Timestamp
     st.markdown("")
     st.markdown(
         f'<div class="timestamp">Cập nhật lúc {datetime.now().strftime("%H:%M:%S %d/%m/%Y")} '
-        f'&nbsp;|&nbsp; Giá được cache 5 phút</div>',
+        f'&nbsp;|&nbsp; {describe_price_cache_policy()}</div>',
         unsafe_allow_html=True,
     )
 
 
 # ============================================================
-# MAIN ENTRY POINT - TABS
+# MAIN ENTRY POINT - CHỌN TÀI KHOẢN
 # ============================================================
 
-# Khởi tạo Tabs
-tab1, tab2 = st.tabs(["📑 Danh mục Tổng", "📑 Danh mục Margin"])
+# Chỉ render tài khoản đang chọn; tài khoản khác không tính toán / lấy giá cho tới khi được mở
+active_tab = st.segmented_control(
+    "Tài khoản",
+    options=TAB_IDS,
+    format_func=lambda t: ACCOUNTS[t][0],
+    default=TAB_IDS[0],
+    required=True,
+    key="active_tab",
+    label_visibility="collapsed",
+)
+render_tab_content(active_tab, ACCOUNTS[active_tab][1])
 
-with tab1:
-    render_tab_content("tab1", "Tài khoản 1 (Đuôi 1)")
-    
-with tab2:
-    render_tab_content("tab2", "Tài khoản 6 (Margin)")
\ No newline at end of file
+# ============================================================
+# KẾT THÚC TRACE + PANEL HIỆU NĂNG (CHỈ ADMIN)
+# ============================================================
+# Panel chỉ hiện khi mở trang với ?admin=<DMFM_ADMIN_TOKEN>; log JSON luôn được ghi.
+# Thống kê Supabase (cộng dồn cả tiến trình) được ghi lại ra file Prometheus mỗi lần chạy.
+_perf_trace.label = active_tab
+_perf_record = finish_run(_perf_trace)
+export_prometheus()
+_admin_token = os.getenv("DMFM_ADMIN_TOKEN")
+if _admin_token and st.query_params.get("admin") == _admin_token:
+    render_perf_panel(_perf_record)
@@ -0,0 +1,242 @@
+"""Benchmark các đường nóng: lấy giá, tính chỉ số danh mục, thống kê vị thế đã đóng, dựng bảng HTML.
+
+Dữ liệu tổng hợp (danh mục + lịch sử đã đóng) ở 10 / 100 / 1k / 10k dòng; vnstock được thay
+bằng stub trả dữ liệu giả (không gọi mạng), Supabase được thay bằng các record tổng hợp.
+Cache đĩa / kho OHLCV dùng thư mục tạm nên không đụng vào .cache/ của app.
+
+Mỗi stage báo thời gian (median / min của --repeat lần chạy) và bộ nhớ đỉnh (tracemalloc).
+
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --sizes 100 1000 --repeat 7 --json bench.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import date, timedelta
+from pathlib import Path
+
+# Cache đĩa / kho OHLCV trong thư mục tạm - phải đặt trước khi import utils
+_TMP_DIR = tempfile.mkdtemp(prefix="dmfm_bench_")
+os.environ.setdefault("DMFM_CACHE_PATH", os.path.join(_TMP_DIR, "cache.sqlite3"))
+os.environ.setdefault("DMFM_HISTORY_PATH", os.path.join(_TMP_DIR, "ohlcv.sqlite3"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+import streamlit as st
+from streamlit import logger as st_logger
+
+# Chạy ngoài `streamlit run`: tắt cảnh báo "No runtime found" / "missing ScriptRunContext"
+st_logger.set_log_level("error")
+
+from utils import data_processing, ui_components, vnstock_gateway
+
+DEFAULT_SIZES = [10, 100, 1_000, 10_000]
+INDUSTRIES = ["Ngân hàng", "Bất động sản", "Công nghệ Thông tin", "Thực phẩm và đồ uống", "Tài nguyên Cơ bản"]
+
+
+# ============================================================
+# STUB VNSTOCK
+# ============================================================
+def _symbol(i: int) -> str:
+    """Mã CP giả 3-4 ký tự, duy nhất theo i."""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    s = ""
+    i += 26 * 26  # luôn >= 3 ký tự
+    while i:
+        i, r = divmod(i, 26)
+        s = letters[r] + s
+    return s
+
+
+def _stub_price(symbol: str) -> float:
+    """Giá giả cố định theo mã (VND)."""
+    return 10_000 + (zlib.crc32(symbol.encode()) % 900) * 100
+
+
+class StubTrading:
+    def __init__(self, source=None):
+        pass
+
+    def price_board(self, symbols_list, **kwargs):
+        prices = [_stub_price(s) for s in symbols_list]
+        return pd.DataFrame({"listing_symbol": symbols_list, "match_match_price": prices, "listing_ref_price": prices})
+
+
+class StubListing:
+    symbols = []
+
+    def __init__(self, source=None):
+        pass
+
+    def symbols_by_industries(self):
+        n = len(self.symbols)
+        return pd.DataFrame({
+            "symbol": self.symbols,
+            "icb_level": [2] * n,
+            "icb_name": [INDUSTRIES[i % len(INDUSTRIES)] for i in range(n)],
+        })
+
+
+class StubCompany:
+    def __init__(self, symbol, source=None):
+        self.symbol = symbol
+
+    def overview(self):
+        return pd.DataFrame({"symbol": [self.symbol], "icb_name2": [INDUSTRIES[0]]})
+
+
+class StubQuote:
+    def __init__(self, symbol, source=None):
+        self.symbol = symbol
+
+    def history(self, start=None, end=None, interval="1D", length=None):
+        close = _stub_price(self.symbol) / 1000
+        days = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=22)
+        return pd.DataFrame({"time": days, "open": close, "high": close, "low": close, "close": close, "volume": 1e5})
+
+
+def install_stubs(symbols):
+    """Thay các lớp vnstock mà utils/vnstock_gateway gọi ở chế độ live bằng stub."""
+    StubListing.symbols = list(symbols)
+    vnstock_gateway.Trading = StubTrading
+    vnstock_gateway.Listing = StubListing
+    vnstock_gateway.Company = StubCompany
+    vnstock_gateway.Quote = StubQuote
+
+
+# ============================================================
+# DỮ LIỆU TỔNG HỢP (thay cho Supabase)
+# ============================================================
+def synthetic_portfolio(n: int, rng: random.Random):
+    start = date(2024, 1, 2)
+    rows = []
+    for i in range(n):
+        gia_von = rng.randrange(10_000, 100_000, 100)
+        row = {
+            "id": i + 1,
+            "tab_id": "tab1",
+            "ma_cp": _symbol(i),
+            "ngay_mua": (start + timedelta(days=rng.randrange(600))).isoformat(),
+            "gia_von": gia_von,
+            "ngay_mua_2": None,
+            "gia_von_2": None,
+            "ty_trong": rng.choice([5, 10, 15, 20]),
+        }
+        if rng.random() < 0.3:
+            row["ngay_mua_2"] = (start + timedelta(days=rng.randrange(600, 700))).isoformat()
+            row["gia_von_2"] = rng.randrange(10_000, 100_000, 100)
+        rows.append(row)
+    return rows
+
+
+def synthetic_closed(n: int, rng: random.Random):
+    start = date(2023, 1, 2)
+    rows = []
+    for i in range(n):
+        gia_von = rng.randrange(10_000, 100_000, 100)
+        gia_ban = rng.randrange(10_000, 100_000, 100)
+        profit_pct = (gia_ban - gia_von) / gia_von * 100
+        ngay_mua = start + timedelta(days=rng.randrange(600))
+        rows.append({
+            "id": i + 1,
+            "tab_id": "tab1",
+            "ma_cp": _symbol(rng.randrange(2_000)),
+            "ngay_mua": ngay_mua.isoformat(),
+            "gia_von": gia_von,
+            "ngay_mua_2": None,
+            "gia_von_2": None,
+            "ty_trong": 10,
+            "ngay_ban": (ngay_mua + timedelta(days=rng.randrange(1, 200))).isoformat(),
+            "gia_ban": gia_ban,
+            "profit_pct": profit_pct,
+            "loai": "chot_loi" if profit_pct >= 0 else "cat_lo",
+        })
+    return rows
+
+
+# ============================================================
+# ĐO
+# ============================================================
+def reset_caches():
+    """Đưa các tầng cache về trạng thái nguội (bộ nhớ, đĩa, cache HTML từng dòng)."""
+    st.cache_data.clear()
+    data_processing.market_cache.clear()
+    ui_components._portfolio_row_cells.cache_clear()
+    ui_components._closed_row_cells.cache_clear()
+
+
+def measure(fn, repeat: int, setup=None):
+    """Chạy fn repeat lần, trả về (median giây, min giây, bộ nhớ đỉnh byte)."""
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(times), min(times), peak
+
+
+def run_size(n: int, repeat: int, seed: int):
+    rng = random.Random(seed)
+    portfolio = synthetic_portfolio(n, rng)
+    closed = synthetic_closed(n, rng)
+    install_stubs(sorted({r["ma_cp"] for r in portfolio + closed}))
+    symbols = [r["ma_cp"] for r in portfolio]
+
+    # Lấy giá lạnh chỉ chạy 1 lần cho mỗi lượt đo vì mỗi lần phải xóa cache
+    cold_repeat = max(1, min(repeat, 3))
+    rows = data_processing.calculate_portfolio_metrics(portfolio)
+    stages = [
+        ("fetch_market_data (cold)", lambda: data_processing.fetch_market_data(symbols), cold_repeat, reset_caches),
+        ("fetch_market_data (warm)", lambda: data_processing.fetch_market_data(symbols), repeat, None),
+        ("calculate_portfolio_metrics (warm)", lambda: data_processing.calculate_portfolio_metrics(portfolio), repeat, None),
+        ("prepare_closed_positions_stats", lambda: data_processing.prepare_closed_positions_stats(closed), repeat, None),
+        ("build_portfolio_table_html (cold)", lambda: ui_components.build_portfolio_table_html(rows, "tab1"), repeat,
+         ui_components._portfolio_row_cells.cache_clear),
+        ("build_portfolio_table_html (warm)", lambda: ui_components.build_portfolio_table_html(rows, "tab1"), repeat, None),
+        ("build_closed_table_html (cold)", lambda: ui_components.build_closed_table_html(closed), repeat,
+         ui_components._closed_row_cells.cache_clear),
+        ("build_closed_table_html (warm)", lambda: ui_components.build_closed_table_html(closed), repeat, None),
+    ]
+
+    results = []
+    for name, fn, stage_repeat, setup in stages:
+        median_s, min_s, peak = measure(fn, stage_repeat, setup)
+        results.append({"rows": n, "stage": name, "median_ms": median_s * 1000, "min_ms": min_s * 1000,
+                        "peak_kib": peak / 1024, "repeat": stage_repeat})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Số dòng danh mục / lịch sử đã đóng")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần chạy mỗi stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON để so sánh giữa các lần đổi code")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'rows':>7}  {'stage':<36} {'median ms':>10} {'min ms':>10} {'peak KiB':>10}")
+    for n in args.sizes:
+        for r in run_size(n, args.repeat, args.seed):
+            results.append(r)
+            print(f"{r['rows']:>7}  {r['stage']:<36} {r['median_ms']:>10.2f} {r['min_ms']:>10.2f} {r['peak_kib']:>10.1f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
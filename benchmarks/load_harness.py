@@ -0,0 +1,216 @@
+"""Kiểm thử tải DMFM.py không cần mạng: AppTest + backend local thay Supabase.
+
+Mỗi phiên (session) là 1 AppTest mới chạy kịch bản: mở trang, vài lần rerun không đổi gì,
+thêm 1 cổ phiếu, sửa, bán, xóa 1 vị thế và xóa 1 giao dịch đã đóng. Mỗi bước đo thời gian
+rerun và số lần gọi backend (theo bảng / thao tác). Báo p50 / p95 theo từng bước.
+
+- Supabase: DMFM_BACKEND=local (utils/local_backend.py), seed bằng dữ liệu tổng hợp,
+  độ trễ giả lập qua --latency-ms / --jitter-ms.
+- vnstock: cache đĩa (DMFM_CACHE_PATH, thư mục tạm) được nạp sẵn giá + bảng ngành, và các
+  lớp vnstock được thay bằng stub của bench_hot_paths cho các mã chưa có trong cache.
+- AppTest không hỗ trợ chọn dòng trên st.dataframe nên harness gắn lựa chọn vào kết quả
+  của các lưới grid_* / closed_grid_*.
+- Cuối cùng in độ trễ trung bình / số dòng theo thao tác từ utils/data_access.py; bản
+  Prometheus text đầy đủ nằm ở DMFM_METRICS_PATH.
+
+    python benchmarks/load_harness.py
+    python benchmarks/load_harness.py --rows 10 100 1000 --sessions 5 --latency-ms 30 --jitter-ms 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+_TMP_DIR = tempfile.mkdtemp(prefix="dmfm_load_")
+os.environ["DMFM_BACKEND"] = "local"
+os.environ["DMFM_CACHE_PATH"] = os.path.join(_TMP_DIR, "cache.sqlite3")
+os.environ["DMFM_HISTORY_PATH"] = os.path.join(_TMP_DIR, "ohlcv.sqlite3")
+os.environ.setdefault("DMFM_METRICS_PATH", os.path.join(_TMP_DIR, "dmfm_metrics.prom"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import random
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from bench_hot_paths import INDUSTRIES, _stub_price, _symbol, install_stubs, synthetic_closed, synthetic_portfolio
+from utils import data_access, data_processing
+from utils.local_backend import get_local_client
+
+APP_PATH = str(Path(__file__).resolve().parent.parent / "DMFM.py")
+IDLE_RERUNS = 3
+# TTL của giá nạp sẵn: đủ dài để không hết hạn trong lúc chạy
+SEED_TTL = 24 * 3600
+
+
+# ============================================================
+# LỰA CHỌN DÒNG TRÊN LƯỚI (AppTest không tự chọn được)
+# ============================================================
+_selection = {}
+_st_dataframe = st.dataframe
+
+
+def _dataframe_with_selection(data=None, *args, key=None, **kwargs):
+    result = _st_dataframe(data, *args, key=key, **kwargs)
+    for prefix, rows in _selection.items():
+        if key and key.startswith(prefix):
+            return SimpleNamespace(selection=SimpleNamespace(rows=rows, columns=[]))
+    return result
+
+
+st.dataframe = _dataframe_with_selection
+
+
+def select(prefix: str, rows):
+    """Chọn các dòng (theo vị trí) trên lưới có key bắt đầu bằng prefix, [] để bỏ chọn."""
+    _selection[prefix] = list(rows)
+
+
+# ============================================================
+# DỮ LIỆU
+# ============================================================
+def seed(n_rows: int, n_sessions: int, seed_value: int):
+    """Nạp backend local + cache đĩa cho danh mục / lịch sử n_rows dòng ở tab1."""
+    rng = random.Random(seed_value)
+    portfolio = synthetic_portfolio(n_rows, rng)
+    closed = synthetic_closed(n_rows, rng)
+    data = {"portfolio": portfolio, "closed_positions": closed}
+
+    # Mã sẽ được thêm trong các phiên: nằm ngoài danh mục nhưng đã có giá trong cache
+    extra = [_symbol(n_rows + i) for i in range(n_sessions)]
+    symbols = sorted({r["ma_cp"] for r in portfolio + closed} | set(extra))
+    install_stubs(symbols)
+    cache = data_processing.market_cache
+    cache.clear()
+    cache.set_many({data_processing._price_key(s): float(_stub_price(s)) for s in symbols}, SEED_TTL)
+    cache.set(data_processing.INDUSTRY_MAP_KEY, {s: INDUSTRIES[i % len(INDUSTRIES)] for i, s in enumerate(symbols)}, SEED_TTL)
+    st.cache_data.clear()
+    return data, extra
+
+
+# ============================================================
+# KỊCH BẢN 1 PHIÊN
+# ============================================================
+class Session:
+    def __init__(self, timeout: float):
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.steps = []
+
+    def step(self, name: str, action=None):
+        """Thực hiện action (click / nhập) rồi rerun, ghi lại thời gian và số lần gọi backend."""
+        client = get_local_client()
+        before = Counter(client.calls)
+        if action:
+            action(self.at)
+        t0 = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - t0
+        if self.at.exception:
+            raise RuntimeError(f"{name}: {self.at.exception[0].message}")
+        calls = Counter(client.calls)
+        calls.subtract(before)
+        self.steps.append((name, elapsed, +calls))
+
+
+def run_session(new_symbol: str, timeout: float) -> list:
+    s = Session(timeout)
+    select("grid_", [])
+    select("closed_grid_", [])
+
+    s.step("first_load")
+    for _ in range(IDLE_RERUNS):
+        s.step("idle_rerun")
+
+    # Thêm: mở dialog, nhập, rồi bấm lưu (bấm lại nút mở dialog vì AppTest chạy lại cả trang)
+    s.step("add_open", lambda at: at.button(key="add_btn_tab1").click())
+
+    def add(at):
+        at.text_input(key="new_sym_tab1").input(new_symbol)
+        at.number_input(key="new_prc1_tab1").set_value(25000)
+        at.button(key="add_btn_tab1").click()
+        at.button(key="add_submit_tab1").click()
+    s.step("add_submit", add)
+
+    # Sửa vị thế đầu tiên
+    select("grid_", [0])
+    s.step("select_row")
+    s.step("edit_open", lambda at: at.button(key="edit_tab1").click())
+    item_id = s.at.session_state["action_tab1"]["id"]
+
+    def edit(at):
+        at.number_input(key=f"eprice_tab1_{item_id}").set_value(30000)
+        at.button[[b.label for b in at.button].index("✅ Lưu lại")].click()
+    s.step("edit_submit", edit)
+
+    # Bán vị thế đầu tiên
+    select("grid_", [0])
+    s.step("sell_open", lambda at: at.button(key="sell_tab1").click())
+    item_id = s.at.session_state["action_tab1"]["id"]
+
+    def sell(at):
+        at.number_input(key=f"sprice_tab1_{item_id}").set_value(32000)
+        at.button[[b.label for b in at.button].index("✅ Xác nhận bán")].click()
+    s.step("sell_submit", sell)
+
+    # Xóa vị thế đầu tiên
+    select("grid_", [0])
+    s.step("delete", lambda at: at.button(key="del_tab1").click())
+
+    # Xóa giao dịch đã đóng đầu tiên
+    select("grid_", [])
+    select("closed_grid_", [0])
+    s.step("select_closed")
+    s.step("delete_closed", lambda at: at.button(key="del_closed_tab1").click())
+    select("closed_grid_", [])
+    return s.steps
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1_000], help="Số dòng danh mục / lịch sử của tab1")
+    parser.add_argument("--sessions", type=int, default=3, help="Số phiên chạy kịch bản cho mỗi cỡ dữ liệu")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Độ trễ giả lập mỗi request backend")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Dao động ngẫu nhiên thêm vào độ trễ")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout mỗi lần rerun (giây)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    client = get_local_client()
+    client.latency_ms = args.latency_ms
+    client.jitter_ms = args.jitter_ms
+
+    print(f"{'rows':>6}  {'step':<14} {'n':>3} {'p50 ms':>9} {'p95 ms':>9}  backend calls / step")
+    for n_rows in args.rows:
+        data, extra = seed(n_rows, args.sessions, args.seed)
+        timings = defaultdict(list)
+        calls = defaultdict(Counter)
+        for i in range(args.sessions):
+            client.load(data)
+            for name, elapsed, step_calls in run_session(extra[i], args.timeout):
+                timings[name].append(elapsed * 1000)
+                calls[name].update(step_calls)
+        for name, values in timings.items():
+            per_step = {f"{t}.{op}": round(c / len(values), 1) for (t, op), c in sorted(calls[name].items())}
+            print(f"{n_rows:>6}  {name:<14} {len(values):>3} {percentile(values, 50):>9.1f} {percentile(values, 95):>9.1f}  {per_step}")
+
+    print(f"\n{'operation':<22} {'table':<18} {'requests':>8} {'errors':>6} {'rows/req':>9} {'avg ms':>8}")
+    for (op, table), s in sorted(data_access.stats.snapshot().items()):
+        n = s["requests"] or 1
+        print(f"{op:<22} {table:<18} {s['requests']:>8} {s['errors']:>6} {s['rows'] / n:>9.1f} {s['latency_sum'] / n * 1000:>8.2f}")
+    print(f"Prometheus: {os.environ['DMFM_METRICS_PATH']}")
+
+
+if __name__ == "__main__":
+    main()
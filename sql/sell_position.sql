@@ -0,0 +1,43 @@
+-- ============================================================
+-- BÁN 1 VỊ THẾ (CHỐT LỜI / CẮT LỖ) TRONG 1 TRANSACTION
+-- ============================================================
+-- Chuyển 1 dòng từ portfolio sang closed_positions và trả về toàn bộ
+-- danh mục + lịch sử đã đóng của tab đó, trong 1 request RPC:
+--
+--   supabase.rpc("sell_position", {"p_item_id": 12, "p_closed": {...}})
+--
+-- p_closed chứa các cột của closed_positions (ma_cp, ngay_mua, gia_von,
+-- ngay_mua_2, gia_von_2, ty_trong, ngay_ban, gia_ban, profit_pct, loai);
+-- tab_id được lấy từ dòng portfolio bị bán.
+-- Nếu vị thế không còn tồn tại (đã bán/xóa ở nơi khác) thì raise lỗi và
+-- không ghi gì cả.
+--
+-- Chạy file này 1 lần trong Supabase SQL Editor.
+
+create or replace function sell_position(p_item_id bigint, p_closed jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_pos portfolio%rowtype;
+begin
+    delete from portfolio where id = p_item_id returning * into v_pos;
+    if not found then
+        raise exception 'Vị thế % không tồn tại', p_item_id using errcode = 'P0002';
+    end if;
+
+    insert into closed_positions (
+        ma_cp, ngay_mua, gia_von, ngay_mua_2, gia_von_2, ty_trong,
+        ngay_ban, gia_ban, profit_pct, loai, tab_id
+    )
+    select
+        r.ma_cp, r.ngay_mua, r.gia_von, r.ngay_mua_2, r.gia_von_2, r.ty_trong,
+        r.ngay_ban, r.gia_ban, r.profit_pct, r.loai, v_pos.tab_id
+    from jsonb_populate_record(null::closed_positions, p_closed) as r;
+
+    return jsonb_build_object(
+        'portfolio', (select coalesce(jsonb_agg(p), '[]'::jsonb) from portfolio p where p.tab_id = v_pos.tab_id),
+        'closed', (select coalesce(jsonb_agg(c), '[]'::jsonb) from closed_positions c where c.tab_id = v_pos.tab_id)
+    );
+end;
+$$;
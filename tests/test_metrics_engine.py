@@ -0,0 +1,234 @@
+"""So khớp utils/metrics_engine.py với code tính từng dòng trước khi vector hóa.
+
+Các hàm _legacy_* bên dưới là bản sao nguyên văn phần tính toán của
+calculate_portfolio_metrics / prepare_closed_positions_stats cũ. Số thực so sánh gần
+đúng vì numpy cộng theo thứ tự khác vòng lặp (lệch ở vài bit cuối).
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# data_processing mở cache / kho lịch sử trên đĩa khi import: trỏ sang thư mục tạm
+_TMP_DIR = tempfile.mkdtemp(prefix="dmfm_test_")
+os.environ.setdefault("DMFM_CACHE_PATH", os.path.join(_TMP_DIR, "cache.sqlite3"))
+os.environ.setdefault("DMFM_HISTORY_PATH", os.path.join(_TMP_DIR, "ohlcv.sqlite3"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.data_processing import _metric_rows, prepare_closed_positions_stats
+from utils.metrics_engine import closed_stats, portfolio_frame, portfolio_totals
+
+
+# ============================================================
+# CODE CŨ (TÍNH TỪNG DÒNG)
+# ============================================================
+def _legacy_metric_rows(curr_portfolio, prices, industries, stale):
+    rows = []
+    for item in curr_portfolio:
+        ma_cp = item["ma_cp"]
+        market_price = prices.get(ma_cp)
+        nganh = industries.get(ma_cp, "—")
+
+        # Giá vốn trung bình nếu mua 2 lần
+        gia_von_avg = item["gia_von"]
+        if item.get("gia_von_2"):
+            gia_von_avg = (item["gia_von"] + item["gia_von_2"]) / 2
+
+        if market_price:
+            profit_pct = (market_price - gia_von_avg) / gia_von_avg * 100
+            display_price = market_price
+        else:
+            profit_pct = 0.0
+            display_price = gia_von_avg
+
+        rows.append({
+            "id": item["id"],
+            "ma_cp": ma_cp,
+            "ngay_mua": item["ngay_mua"],
+            "gia_von": item["gia_von"],
+            "ngay_mua_2": item.get("ngay_mua_2"),
+            "gia_von_2": item.get("gia_von_2"),
+            "gia_von_avg": gia_von_avg,
+            "current_price": display_price,
+            "price_stale": ma_cp in stale,
+            "profit_pct": profit_pct,
+            "ty_trong": item.get("ty_trong", 0),
+            "nganh": nganh,
+            "raw_item": item,
+        })
+    return rows
+
+
+def _legacy_closed_stats(curr_closed):
+    if not curr_closed:
+        return None
+
+    chot_loi = [c for c in curr_closed if c["loai"] == "chot_loi"]
+    cat_lo = [c for c in curr_closed if c["loai"] == "cat_lo"]
+
+    total_closed = len(curr_closed)
+    win_rate = len(chot_loi) / total_closed * 100 if total_closed > 0 else 0
+    avg_profit = sum(c["profit_pct"] for c in chot_loi) / len(chot_loi) if chot_loi else 0
+    avg_loss = sum(c["profit_pct"] for c in cat_lo) / len(cat_lo) if cat_lo else 0
+
+    return {
+        "total_closed": total_closed,
+        "chot_loi_count": len(chot_loi),
+        "cat_lo_count": len(cat_lo),
+        "win_rate": win_rate,
+        "avg_profit": avg_profit,
+        "avg_loss": avg_loss,
+        "chot_loi": chot_loi,
+        "cat_lo": cat_lo,
+    }
+
+
+def _legacy_total_weight(curr_portfolio):
+    try:
+        return sum([float(item.get("ty_trong", 0)) for item in curr_portfolio])
+    except:  # noqa: E722 - giữ nguyên code cũ
+        return 0
+
+
+# ============================================================
+# DỮ LIỆU
+# ============================================================
+def _position(id_, ma_cp, gia_von, gia_von_2=None, ty_trong=10):
+    return {
+        "id": id_,
+        "ma_cp": ma_cp,
+        "ngay_mua": "2026-01-05",
+        "gia_von": gia_von,
+        "ngay_mua_2": "2026-03-02" if gia_von_2 else None,
+        "gia_von_2": gia_von_2,
+        "ty_trong": ty_trong,
+        "tab_id": "tab1",
+    }
+
+
+def _closed(id_, loai, profit_pct):
+    return {"id": id_, "ma_cp": f"M{id_:03d}", "loai": loai, "profit_pct": profit_pct, "tab_id": "tab1"}
+
+
+PORTFOLIO = [
+    _position(1, "FPT", 92_600),                      # 1 lần mua
+    _position(2, "HPG", 25_150, gia_von_2=27_300),    # mua 2 lần
+    _position(3, "VNM", 61_000, gia_von_2=0),         # giá vốn lần 2 = 0 coi như chưa mua
+    _position(4, "MWG", 48_750),                      # giá None
+    _position(5, "SSI", 33_333, gia_von_2=31_111),    # giá 0
+    _position(6, "ACB", 24_900),                      # không có trong dict giá
+]
+PRICES = {"FPT": 101_300.0, "HPG": 26_050.0, "VNM": 58_400.0, "MWG": None, "SSI": 0}
+INDUSTRIES = {"FPT": "Công nghệ Thông tin", "HPG": "Tài nguyên Cơ bản"}
+STALE = {"HPG"}
+
+
+def _assert_rows_match(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.keys() == e.keys()
+        for key, value in e.items():
+            if isinstance(value, float):
+                assert a[key] == pytest.approx(value), key
+            else:
+                assert a[key] == value, key
+
+
+# ============================================================
+# DANH MỤC
+# ============================================================
+def test_metric_rows_match_legacy():
+    _assert_rows_match(
+        _metric_rows(PORTFOLIO, PRICES, INDUSTRIES, STALE),
+        _legacy_metric_rows(PORTFOLIO, PRICES, INDUSTRIES, STALE),
+    )
+
+
+@pytest.mark.parametrize("price", [None, 0, 0.0])
+def test_missing_price_falls_back_to_average_cost(price):
+    portfolio = [_position(1, "FPT", 92_600, gia_von_2=90_000)]
+    prices = {"FPT": price}
+    _assert_rows_match(_metric_rows(portfolio, prices, {}, set()), _legacy_metric_rows(portfolio, prices, {}, set()))
+    frame = portfolio_frame(portfolio, prices)
+    assert frame["current_price"].iloc[0] == pytest.approx(91_300)
+    assert frame["profit_pct"].iloc[0] == 0.0
+
+
+def test_portfolio_frame_matches_legacy_columns():
+    frame = portfolio_frame(PORTFOLIO, PRICES)
+    legacy = _legacy_metric_rows(PORTFOLIO, PRICES, {}, set())
+    assert frame["ma_cp"].tolist() == [r["ma_cp"] for r in legacy]
+    for column in ("gia_von_avg", "current_price", "profit_pct"):
+        assert frame[column].tolist() == pytest.approx([r[column] for r in legacy]), column
+
+
+def test_non_numeric_weight_passes_through_rows():
+    portfolio = [_position(1, "FPT", 92_600, ty_trong="abc"), _position(2, "HPG", 25_150, ty_trong=None)]
+    rows = _metric_rows(portfolio, PRICES, {}, set())
+    legacy = _legacy_metric_rows(portfolio, PRICES, {}, set())
+    _assert_rows_match(rows, legacy)
+    assert [r["ty_trong"] for r in rows] == ["abc", None]
+    assert portfolio_frame(portfolio, PRICES)["ty_trong"].tolist() == [0.0, 0.0]
+
+
+def test_total_weight_matches_legacy_for_numeric_weights():
+    portfolio = [_position(1, "FPT", 92_600, ty_trong=12.5), _position(2, "HPG", 25_150, ty_trong="7.5")]
+    portfolio.append({k: v for k, v in _position(3, "VNM", 61_000).items() if k != "ty_trong"})
+    totals = portfolio_totals(portfolio_frame(portfolio, {}))
+    assert totals["total_weight"] == pytest.approx(_legacy_total_weight(portfolio))
+    assert totals["total_positions"] == 3
+
+
+def test_total_weight_skips_non_numeric_weight():
+    # Code cũ bắt mọi lỗi và đưa cả tổng về 0; engine chỉ tính dòng lỗi là 0
+    portfolio = [_position(1, "FPT", 92_600, ty_trong=12.5), _position(2, "HPG", 25_150, ty_trong="abc")]
+    assert _legacy_total_weight(portfolio) == 0
+    assert portfolio_totals(portfolio_frame(portfolio, {}))["total_weight"] == pytest.approx(12.5)
+
+
+def test_empty_portfolio():
+    assert _metric_rows([], {}, {}, set()) == _legacy_metric_rows([], {}, {}, set()) == []
+    totals = portfolio_totals(portfolio_frame([], {}))
+    assert totals == {"total_positions": 0, "total_weight": 0.0, "avg_profit_pct": 0.0, "weighted_profit_pct": 0.0}
+
+
+# ============================================================
+# VỊ THẾ ĐÃ ĐÓNG
+# ============================================================
+def _assert_stats_match(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key in ("total_closed", "chot_loi_count", "cat_lo_count", "chot_loi", "cat_lo"):
+        assert actual[key] == expected[key], key
+    for key in ("win_rate", "avg_profit", "avg_loss"):
+        assert actual[key] == pytest.approx(expected[key]), key
+
+
+@pytest.mark.parametrize("closed", [
+    pytest.param([
+        _closed(1, "chot_loi", 12.345), _closed(2, "cat_lo", -7.1), _closed(3, "chot_loi", 231.78877906179374),
+        _closed(4, "chot_loi", 0.1), _closed(5, "cat_lo", -0.3333),
+    ], id="mixed"),
+    pytest.param([_closed(1, "cat_lo", -5.5), _closed(2, "cat_lo", -12.25), _closed(3, "cat_lo", -0.1)], id="only_loss"),
+    pytest.param([_closed(1, "chot_loi", 3.0)], id="only_profit"),
+])
+def test_closed_stats_match_legacy(closed):
+    _assert_stats_match(closed_stats(closed), _legacy_closed_stats(closed))
+    _assert_stats_match(prepare_closed_positions_stats(closed), _legacy_closed_stats(closed))
+
+
+def test_only_loss_has_zero_avg_profit():
+    stats = closed_stats([_closed(1, "cat_lo", -5.5), _closed(2, "cat_lo", -4.5)])
+    assert stats["win_rate"] == 0
+    assert stats["avg_profit"] == 0
+    assert stats["avg_loss"] == pytest.approx(-5.0)
+
+
+def test_empty_closed_list():
+    assert prepare_closed_positions_stats([]) is None
+    assert _legacy_closed_stats([]) is None
+    stats = closed_stats([])
+    assert (stats["total_closed"], stats["win_rate"], stats["avg_profit"], stats["avg_loss"]) == (0, 0, 0, 0)
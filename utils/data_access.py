@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+from supabase import create_client
+
+from utils.local_backend import get_local_client
+from utils.perf_trace import span, count
+
+# ============================================================
+# TRUY CẬP DỮ LIỆU SUPABASE (CÓ ĐO ĐẾM)
+# ============================================================
+# Mọi request tới Supabase của app đi qua _request(): mỗi request (1 round trip) được đếm
+# theo (thao tác, bảng) cùng độ trễ (histogram), số dòng trả về và số lỗi. Thống kê xuất
+# ra file dạng Prometheus text (DMFM_METRICS_PATH, mặc định .cache/dmfm_metrics.prom; đặt
+# rỗng để tắt) để node_exporter textfile collector / script kiểm thử tải đọc được.
+# Mỗi request cũng được ghi vào trace của lần chạy hiện tại (utils/perf_trace.py).
+
+DEFAULT_METRICS_PATH = os.getenv("DMFM_METRICS_PATH", ".cache/dmfm_metrics.prom")
+# Biên trên các bucket độ trễ (giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Tên metric (sau tiền tố dmfm_db_) -> (kiểu, mô tả)
+_METRIC_FAMILIES = {
+    "requests_total": ("counter", "Số request Supabase theo thao tác và bảng."),
+    "errors_total": ("counter", "Số request Supabase bị lỗi."),
+    "rows_total": ("counter", "Tổng số dòng Supabase trả về."),
+    "request_duration_seconds": ("histogram", "Độ trễ request Supabase."),
+}
+
+
+class OperationStats:
+    """Số request / lỗi / dòng và histogram độ trễ của 1 (thao tác, bảng)."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency_sum = 0.0
+        # bucket_counts[i] = số request có độ trễ <= LATENCY_BUCKETS[i] (không cộng dồn); phần tử cuối là +Inf
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float, rows: int, error: bool):
+        self.requests += 1
+        self.errors += int(error)
+        self.rows += rows
+        self.latency_sum += seconds
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+
+class DataAccessStats:
+    """Thống kê request Supabase cho cả tiến trình (mọi phiên dùng chung)."""
+
+    def __init__(self):
+        self._ops = {}
+        self._lock = threading.Lock()
+
+    def observe(self, op: str, table: str, seconds: float, rows: int, error: bool):
+        with self._lock:
+            self._ops.setdefault((op, table), OperationStats()).observe(seconds, rows, error)
+
+    def snapshot(self) -> dict:
+        """{(thao tác, bảng): {"requests", "errors", "rows", "latency_sum"}}."""
+        with self._lock:
+            return {
+                key: {"requests": s.requests, "errors": s.errors, "rows": s.rows, "latency_sum": s.latency_sum}
+                for key, s in self._ops.items()
+            }
+
+    def to_prometheus(self) -> str:
+        """Thống kê dạng Prometheus text exposition format (mỗi metric 1 khối HELP / TYPE / mẫu)."""
+        with self._lock:
+            ops = sorted(self._ops.items())
+            families = {
+                "requests_total": [], "errors_total": [], "rows_total": [], "request_duration_seconds": [],
+            }
+            for (op, table), s in ops:
+                labels = f'op="{op}",table="{table}"'
+                families["requests_total"].append(f"dmfm_db_requests_total{{{labels}}} {s.requests}")
+                families["errors_total"].append(f"dmfm_db_errors_total{{{labels}}} {s.errors}")
+                families["rows_total"].append(f"dmfm_db_rows_total{{{labels}}} {s.rows}")
+                histogram = families["request_duration_seconds"]
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), s.bucket_counts):
+                    cumulative += n
+                    histogram.append(f'dmfm_db_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                histogram.append(f"dmfm_db_request_duration_seconds_sum{{{labels}}} {s.latency_sum:.6f}")
+                histogram.append(f"dmfm_db_request_duration_seconds_count{{{labels}}} {s.requests}")
+
+        lines = []
+        for family, (kind, help_text) in _METRIC_FAMILIES.items():
+            lines.append(f"# HELP dmfm_db_{family} {help_text}")
+            lines.append(f"# TYPE dmfm_db_{family} {kind}")
+            lines.extend(families[family])
+        return "\n".join(lines) + "\n"
+
+
+stats = DataAccessStats()
+
+
+def export_prometheus(path: str = DEFAULT_METRICS_PATH):
+    """Ghi thống kê ra file Prometheus text (ghi file tạm rồi đổi tên để không đọc phải file dở)."""
+    if not path:
+        return
+    try:
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(stats.to_prometheus(), encoding="utf-8")
+        tmp.replace(target)
+    except OSError as e:
+        print(f"Metrics export error: {e}")
+
+
+# Số dòng mỗi trang khi đọc cả bảng; không được lớn hơn max-rows của project Supabase
+PAGE_SIZE = int(os.getenv("DMFM_PAGE_SIZE", "1000"))
+
+# ============================================================
+# CLIENT
+# ============================================================
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Client Supabase dùng chung, hoặc backend local khi DMFM_BACKEND=local."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if os.getenv("DMFM_BACKEND") == "local":
+                # Backend trong bộ nhớ để chạy offline / kiểm thử tải (utils/local_backend.py)
+                _client = get_local_client()
+            else:
+                _client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+        return _client
+
+
+def _select_all(op: str, table: str, column: str, values):
+    """SELECT * ... WHERE column IN (values) đọc theo trang order("id").range() cho tới trang thiếu.
+
+    PostgREST cắt mỗi response ở max-rows (mặc định Supabase 1000) mà không báo lỗi, nên
+    không đọc 1 lần; mỗi trang là 1 request riêng trong thống kê.
+    """
+    values = list(values)
+    rows = []
+    while True:
+        start = len(rows)
+        page = _request(
+            op, table,
+            lambda c: c.table(table).select("*").in_(column, values).order("id").range(start, start + PAGE_SIZE - 1),
+        )
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def _row_count(data) -> int:
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        # RPC sell_position trả {"portfolio": [...], "closed": [...]}
+        return sum(len(v) for v in data.values() if isinstance(v, list))
+    return 0
+
+
+def _request(op: str, table: str, build):
+    """Thực hiện 1 request (build(client) trả về builder có .execute()), đo đếm và trả về .data."""
+    start = time.perf_counter()
+    data = None
+    error = False
+    try:
+        with span(f"db.{op}"):
+            data = build(get_client()).execute().data
+        return data
+    except Exception:
+        error = True
+        raise
+    finally:
+        stats.observe(op, table, time.perf_counter() - start, _row_count(data), error)
+        count(f"db.{op}")
+
+
+# ============================================================
+# DANH MỤC
+# ============================================================
+def load_portfolio(tab_id="tab1"):
+    """Đọc danh mục từ bảng portfolio trên Supabase."""
+    try:
+        return _select_all("load_portfolio", "portfolio", "tab_id", [tab_id])
+    except Exception as e:
+        st.error(f"Lỗi đọc Supabase: {e}")
+        return []
+
+
+def save_portfolio_item(data, tab_id="tab1"):
+    """Thêm 1 record vào bảng portfolio trên Supabase, trả về các dòng vừa thêm."""
+    data["tab_id"] = tab_id
+    return _request("save_portfolio_item", "portfolio", lambda c: c.table("portfolio").insert(data))
+
+
+def update_portfolio_item(item_id, data):
+    """Cập nhật 1 record trong bảng portfolio, trả về các dòng đã cập nhật."""
+    return _request("update_portfolio_item", "portfolio", lambda c: c.table("portfolio").update(data).eq("id", item_id))
+
+
+def delete_portfolio_item(item_id):
+    """Xóa 1 record trong bảng portfolio, trả về các dòng đã xóa."""
+    return _request("delete_portfolio_item", "portfolio", lambda c: c.table("portfolio").delete().eq("id", item_id))
+
+
+# ============================================================
+# VỊ THẾ ĐÃ ĐÓNG (Chốt lời / Cắt lỗ)
+# ============================================================
+def load_closed(tab_id="tab1"):
+    """Đọc danh sách vị thế đã đóng từ Supabase."""
+    try:
+        return _select_all("load_closed", "closed_positions", "tab_id", [tab_id])
+    except Exception as e:
+        st.error(f"Lỗi đọc Supabase: {e}")
+        return []
+
+
+def save_closed_item(data, tab_id="tab1"):
+    """Thêm 1 record vào bảng closed_positions trên Supabase, trả về các dòng vừa thêm."""
+    data["tab_id"] = tab_id
+    return _request("save_closed_item", "closed_positions", lambda c: c.table("closed_positions").insert(data))
+
+
+def sell_portfolio_item(item_id, closed_data):
+    """Bán 1 vị thế: chuyển record từ portfolio sang closed_positions trong 1 transaction.
+
+    Gọi hàm Postgres sell_position (sql/sell_position.sql) qua RPC, trả về
+    {"portfolio": [...], "closed": [...]} mới nhất của tab chứa vị thế.
+    """
+    return _request(
+        "sell_portfolio_item", "rpc:sell_position",
+        lambda c: c.rpc("sell_position", {"p_item_id": item_id, "p_closed": closed_data}),
+    )
+
+
+def delete_closed_items(item_ids):
+    """Xóa các record trong bảng closed_positions theo danh sách id, trả về các dòng đã xóa."""
+    item_ids = list(item_ids)
+    return _request(
+        "delete_closed_items", "closed_positions", lambda c: c.table("closed_positions").delete().in_("id", item_ids)
+    )
+
+
+# ============================================================
+# TẢI 1 LẦN CHO TẤT CẢ CÁC TAB
+# ============================================================
+def load_all_tabs(tab_ids):
+    """Đọc portfolio + closed_positions của nhiều tab bằng truy vấn tab_id IN (...), 2 bảng chạy song song.
+
+    Mỗi bảng đọc theo trang (_select_all) nên nhiều tab dùng chung 1 truy vấn không bị cắt ở max-rows.
+    Trả về (portfolios, closed), mỗi cái là dict {tab_id: [records]}.
+    """
+    tab_ids = list(tab_ids)
+
+    def fetch(table):
+        return _select_all("load_all_tabs", table, "tab_id", tab_ids)
+
+    portfolios = {t: [] for t in tab_ids}
+    closed = {t: [] for t in tab_ids}
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            portfolio_future = executor.submit(fetch, "portfolio")
+            closed_future = executor.submit(fetch, "closed_positions")
+            portfolio_rows = portfolio_future.result()
+            closed_rows = closed_future.result()
+    except Exception as e:
+        st.error(f"Lỗi đọc Supabase: {e}")
+        return portfolios, closed
+
+    for row in portfolio_rows:
+        portfolios.setdefault(row["tab_id"], []).append(row)
+    for row in closed_rows:
+        closed.setdefault(row["tab_id"], []).append(row)
+    return portfolios, closed
@@ -1,75 +1,382 @@
 import streamlit as st
 from datetime import datetime, date
-from vnstock import Quote, Company
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.disk_cache import DiskCache
+from utils.history_store import HistoryStore
+from utils.metrics_engine import portfolio_frame, closed_stats
+from utils.resilience import RetryPolicy, CircuitOpenError, NoDataError, get_breaker
+from utils.market_calendar import price_ttl, INTRADAY_PRICE_TTL
+from utils.vnstock_gateway import gateway
+from utils.perf_trace import span, count
 
 import time
 
-@st.cache_data(ttl=300, show_spinner=False)
+# Số luồng tối đa khi lấy giá/ngành song song và thời gian chờ tối đa cho 1 mã (giây)
+MAX_FETCH_WORKERS = 8
+FETCH_TIMEOUT = 15
+# Chu kỳ kiểm tra lại (giây) khi còn mã đang xếp hàng chờ luồng, chưa bắt đầu tính giờ
+DEADLINE_POLL_INTERVAL = 0.05
+
+# TTL (giây) của cache trên đĩa, dùng chung cho mọi process Streamlit.
+# TTL giá theo lịch giao dịch (utils.market_calendar.price_ttl): ngắn trong phiên, ngoài phiên tới phiên kế tiếp
+INDUSTRY_TTL = 86400
+
+market_cache = DiskCache()
+history_store = HistoryStore()
+
+# Chính sách retry cho từng loại request vnstock (breaker theo nguồn nằm ở utils.resilience)
+PRICE_RETRY = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0)
+# Luồng rerun chỉ thử 1 lần, không ngủ backoff; PRICE_RETRY chạy ở luồng nền (_refresh_prices)
+PRICE_FIRST_ATTEMPT = RetryPolicy(max_attempts=1)
+BOARD_RETRY = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0)
+INDUSTRY_RETRY = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=2.0)
+
+
+def _price_key(symbol: str) -> str:
+    return f"price:{symbol}"
+
+
+def _industry_key(symbol: str) -> str:
+    return f"industry:{symbol}"
+
+
+INDUSTRY_MAP_KEY = "industry_map"
+
+
+def _fetch_market_price(symbol: str, policy: RetryPolicy = PRICE_RETRY) -> float:
+    """Gọi vnstock lấy giá đóng cửa mới nhất (VND) và ghi vào cache trên đĩa.
+
+    Không đọc cache. Raise CircuitOpenError khi nguồn đang ngắt mạch, NoDataError khi mã không
+    có dữ liệu (mã sai / hủy niêm yết, không retry), hoặc lỗi cuối cùng khi hết số lần thử.
+    """
+    def fetch():
+        # Chỉ tải các nến mới hơn dữ liệu đã có trong kho lịch sử
+        history_store.update(symbol)
+        close = history_store.last_close(symbol)
+        if close is None:
+            raise NoDataError(f"vnstock không trả về dữ liệu cho {symbol}")
+        return close
+
+    raw_price = policy.call(fetch, breaker=get_breaker("quote_history"))
+    # vnstock trả giá theo đơn vị nghìn VND (VD: 92.6 = 92,600 VND)
+    price = raw_price * 1000
+    market_cache.set(_price_key(symbol), price, price_ttl())
+    return price
+
+
+@st.cache_data(ttl=INTRADAY_PRICE_TTL, show_spinner=False)
 def get_market_price(symbol: str) -> float | None:
-    """Lấy giá đóng cửa mới nhất của 1 mã cổ phiếu (đơn vị: VND) với cơ chế retry và xử lý lỗi."""
-    max_retries = 3
-    retry_delay = 1  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            quote = Quote(symbol=symbol)
-            df = quote.history(length="1M", interval="1D")
-            
-            if df is not None and not df.empty:
-                # vnstock trả giá theo đơn vị nghìn VND (VD: 92.6 = 92,600 VND)
-                raw_price = float(df["close"].iloc[-1])
-                return raw_price * 1000
-            else:
-                st.warning(f"⚠️ vnstock không trả về dữ liệu cho {symbol}. (Thử lại {attempt + 1}/{max_retries})")
-                
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                continue
-            else:
-                st.error(f"❌ Lỗi lấy giá {symbol} sau {max_retries} lần thử: {str(e)}")
-                return None
-                
-    # If all retries failed and no exception was raised but data was empty
-    return None
+    """Lấy giá đóng cửa mới nhất của 1 mã cổ phiếu (đơn vị: VND) mà không chặn lần rerun.
+
+    Chỉ thử gọi vnstock 1 lần. Khi lỗi, trả về giá gần nhất đã biết (nếu có) và giao việc
+    retry có backoff cho luồng nền; xong thì giá mới được đọc ở lần rerun sau.
+    Khi nguồn giá đang bị ngắt mạch thì trả ngay giá gần nhất, không retry.
+    """
+    # Chỉ chạy khi st.cache_data miss; số lần hit bộ nhớ = get_market_price.calls - .miss
+    count("get_market_price.miss")
+    cached = market_cache.get(_price_key(symbol))
+    if cached is not None:
+        count("get_market_price.disk_hit")
+        return cached
+
+    count("get_market_price.fetch")
+    try:
+        return _fetch_market_price(symbol, PRICE_FIRST_ATTEMPT)
+    except CircuitOpenError:
+        # Không chờ retry khi nguồn đang lỗi hàng loạt: trả ngay giá gần nhất
+        return market_cache.get(_price_key(symbol), allow_expired=True)
+    except NoDataError as e:
+        st.warning(f"⚠️ {e}. Kiểm tra lại mã cổ phiếu.")
+        return market_cache.get(_price_key(symbol), allow_expired=True)
+    except Exception as e:
+        st.warning(f"⚠️ Lỗi lấy giá {symbol}: {str(e)}. Đang thử lại ở nền.")
+        refresh_prices_in_background([symbol])
+        return market_cache.get(_price_key(symbol), allow_expired=True)
+
+
+def get_board_prices(symbols: tuple) -> dict:
+    """Lấy giá khớp mới nhất của nhiều mã CP trong 1 request bảng giá (đơn vị: VND).
+
+    Kết quả được cache theo từng mã trên đĩa (không cache theo cả bộ mã) để có thể
+    xóa riêng giá của từng mã. Mã nào bảng giá không trả về sẽ không có trong dict kết quả.
+    """
+    if not symbols:
+        return {}
+    try:
+        df = BOARD_RETRY.call(
+            lambda: gateway.price_board(symbols),
+            breaker=get_breaker("price_board"),
+        )
+        if df is None or df.empty or "listing_symbol" not in df.columns:
+            return {}
+    except Exception as e:
+        print(f"Error fetching price board for {len(symbols)} symbols: {e}")
+        return {}
+
+    prices = {}
+    for _, r in df.iterrows():
+        # Bảng giá VCI trả giá theo VND; chưa khớp lệnh trong phiên thì dùng giá tham chiếu
+        price = r.get("match_match_price") or r.get("listing_ref_price")
+        if price and str(price).lower() != "nan" and float(price) > 0:
+            prices[str(r["listing_symbol"])] = float(price)
+    market_cache.set_many({_price_key(s): p for s, p in prices.items()}, price_ttl())
+    return prices
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def _load_industry_map() -> dict:
+    """Tải bảng phân ngành ICB cấp 2 cho tất cả mã CP trong 1 request.
+
+    Raise khi lỗi để st.cache_data không giữ kết quả rỗng suốt 1 ngày.
+    """
+    cached = market_cache.get(INDUSTRY_MAP_KEY)
+    if cached is not None:
+        return cached
+    df = BOARD_RETRY.call(gateway.symbols_by_industries, breaker=get_breaker("listing"))
+    if df is None or df.empty:
+        raise ValueError("vnstock không trả về bảng phân ngành")
+    if "icb_level" in df.columns:
+        # vnstock mới trả dạng dài: mỗi mã 1 dòng cho từng cấp ICB
+        df = df[df["icb_level"] == 2]
+        industry_map = dict(zip(df["symbol"], df["icb_name"]))
+    elif "icb_name2" in df.columns:
+        industry_map = dict(zip(df["symbol"], df["icb_name2"]))
+    else:
+        industry_map = dict(zip(df["symbol"], df["industry_name"]))
+    industry_map = {str(k): str(v) for k, v in industry_map.items() if v and str(v).lower() != "nan"}
+    market_cache.set(INDUSTRY_MAP_KEY, industry_map, INDUSTRY_TTL)
+    return industry_map
+
+
+def get_industry_map() -> dict:
+    """Bảng phân ngành {mã CP: ngành ICB cấp 2} cho toàn thị trường (làm mới mỗi ngày)."""
+    try:
+        return _load_industry_map()
+    except Exception as e:
+        print(f"Error fetching industry map: {e}")
+        return {}
 
 
 @st.cache_data(ttl=86400, show_spinner=False)
 def get_single_industry(symbol: str) -> str:
-    """Lấy bảng phân ngành ICB cấp 2 cho một mã CP (cache 1 ngày)."""
+    """Lấy bảng phân ngành ICB cấp 2 cho một mã CP (cache 1 ngày).
+
+    Tra bảng phân ngành toàn thị trường trước, chỉ gọi Company.overview() cho mã không có trong bảng.
+    """
+    count("get_single_industry.miss")
+    nganh = get_industry_map().get(symbol)
+    if nganh:
+        count("get_single_industry.map_hit")
+        return nganh
+    cached = market_cache.get(_industry_key(symbol))
+    if cached is not None:
+        count("get_single_industry.disk_hit")
+        return cached
+    count("get_single_industry.fetch")
     try:
-        company = Company(symbol=symbol, source='VCI')
-        df = company.overview()
+        df = INDUSTRY_RETRY.call(
+            lambda: gateway.company_overview(symbol), breaker=get_breaker("company_overview")
+        )
         if df is not None and not df.empty and 'icb_name2' in df.columns:
             # Handle potential None or NaN values
             val = df['icb_name2'].iloc[0]
             if val and str(val).lower() != 'nan':
+                market_cache.set(_industry_key(symbol), str(val), INDUSTRY_TTL)
                 return str(val)
     except Exception as e:
         print(f"Error fetching industry for {symbol}: {e}")
     return "—"
 
-def calculate_portfolio_metrics(curr_portfolio):
+def invalidate_prices(symbols):
+    """Xóa giá đã cache (bộ nhớ + đĩa) của các mã chỉ định.
+
+    Chỉ ảnh hưởng tới các mã này; giá của mã khác và dữ liệu ngành được giữ nguyên.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    market_cache.delete(_price_key(s) for s in symbols)
+    for s in symbols:
+        get_market_price.clear(s)
+
+
+def price_snapshot_version(symbols) -> str | None:
+    """Phiên bản của ảnh chụp giá các mã: đổi mỗi khi có giá được ghi mới vào cache.
+
+    Dựa trên thời điểm hết hạn (= thời điểm ghi + TTL) của từng giá trên đĩa. Trả về None
+    nếu còn mã chưa có giá hoặc giá đã hết hạn, tức là ảnh chụp chưa ổn định để ghi nhớ.
+    """
+    keys = sorted({_price_key(s) for s in symbols})
+    entries = market_cache.get_entries(keys)
+    now = time.time()
+    if len(entries) < len(keys) or any(expires_at <= now for _, expires_at in entries.values()):
+        return None
+    return str(hash(tuple((k, entries[k][1]) for k in keys)))
+
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dmfm-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_prices(symbols):
+    """Lấy lại giá (có retry + backoff) cho các mã đã hết hạn hoặc vừa lỗi (chạy nền), ghi vào cache trên đĩa."""
+    try:
+        board = get_board_prices(tuple(sorted(symbols)))
+        for symbol in symbols:
+            if symbol not in board:
+                try:
+                    _fetch_market_price(symbol)
+                except Exception as e:
+                    print(f"Background refresh failed for {symbol}: {e}")
+            # Bỏ giá cũ trong st.cache_data để lần rerun sau đọc giá mới từ đĩa
+            get_market_price.clear(symbol)
+    finally:
+        with _refreshing_lock:
+            _refreshing.difference_update(symbols)
+
+
+def refresh_prices_in_background(symbols):
+    """Lên lịch làm mới giá ở luồng nền (stale-while-revalidate), bỏ qua mã đang được làm mới."""
+    with _refreshing_lock:
+        pending = [s for s in dict.fromkeys(symbols) if s not in _refreshing]
+        _refreshing.update(pending)
+    if pending:
+        _refresh_executor.submit(_refresh_prices, pending)
+
+
+def _wait_with_deadlines(tasks: dict, started: dict, workers: int, timeout: float):
+    """Chờ các future trong tasks {future: khóa}, mỗi tác vụ tối đa timeout giây kể từ lúc bắt đầu chạy.
+
+    Tác vụ chưa bắt đầu (đang xếp hàng) chưa bị tính giờ. Dừng khi mọi tác vụ đã xong hoặc
+    quá hạn, hoặc khi cả workers luồng đều bị tác vụ quá hạn chiếm (hàng đợi không thể chạy tiếp).
+    """
+    pending = set(tasks)
+    while pending:
+        now = time.monotonic()
+        deadlines = {f: started[tasks[f]] + timeout for f in pending if tasks[f] in started}
+        expired = {f for f, deadline in deadlines.items() if deadline <= now}
+        waiting = pending - expired
+        if not waiting or len(expired) >= workers:
+            return
+        live = [deadlines[f] for f in waiting if f in deadlines]
+        # Có tác vụ chưa bắt đầu thì kiểm tra lại thường xuyên để bắt đầu tính giờ cho nó
+        wait_for = min(live) - now if live else timeout
+        if len(live) < len(waiting):
+            wait_for = min(wait_for, DEADLINE_POLL_INTERVAL)
+        done, _ = wait(waiting, timeout=max(0.0, wait_for), return_when=FIRST_COMPLETED)
+        pending -= done
+
+
+def fetch_market_data(symbols, max_workers: int = MAX_FETCH_WORKERS, timeout: float = FETCH_TIMEOUT):
+    """Lấy giá và ngành cho nhiều mã CP song song trên một thread pool giới hạn.
+
+    Giá được lấy trước bằng 1 request bảng giá cho tất cả các mã; chỉ những mã
+    bảng giá không trả về mới gọi lịch sử giá từng mã. Ngành tra từ bảng phân ngành
+    toàn thị trường, chỉ mã không có trong bảng mới gọi overview() từng mã.
+    Giá đã hết hạn trên đĩa được trả ngay (stale-while-revalidate) và làm mới ở luồng nền.
+    Trả về (prices, industries, stale). Mã nào quá thời gian chờ sẽ nhận None / "—";
+    stale là tập các mã đang hiển thị giá cũ.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    prices = {s: None for s in symbols}
+    industries = {s: "—" for s in symbols}
+    stale = set()
+    if not symbols:
+        return prices, industries, stale
+
+    with span("fetch.industry_map"):
+        industry_map = get_industry_map()
+    industries.update({s: industry_map[s] for s in symbols if s in industry_map})
+    missing_industry = [s for s in symbols if s not in industry_map]
+
+    # Giá trên đĩa (kể cả sau khi restart) không cần gọi vnstock; giá hết hạn vẫn dùng ngay
+    now = time.time()
+    with span("fetch.disk_cache"):
+        entries = market_cache.get_entries(_price_key(s) for s in symbols)
+    count("prices.disk", len(entries))
+    for s in symbols:
+        if _price_key(s) in entries:
+            prices[s], expires_at = entries[_price_key(s)]
+            if expires_at <= now:
+                stale.add(s)
+    if stale:
+        count("prices.disk_stale", len(stale))
+        refresh_prices_in_background(stale)
+    missing = [s for s in symbols if prices[s] is None]
+    if missing:
+        with span("fetch.price_board"):
+            board = get_board_prices(tuple(sorted(missing)))
+        count("prices.board", len(board))
+        prices.update({s: board[s] for s in missing if s in board})
+        missing = [s for s in missing if prices[s] is None]
+
+    # Gắn ScriptRunContext cho luồng con để st.cache_data / st.warning hoạt động đúng
+    ctx = get_script_run_ctx()
+    # Thời điểm từng tác vụ bắt đầu chạy trên worker: hạn chót của 1 mã tính từ lúc này
+    started = {}
+
+    def run(fn, symbol):
+        started[(fn, symbol)] = time.monotonic()
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(symbol)
+
+    if not missing and not missing_industry:
+        return prices, industries, stale
+
+    count("get_market_price.calls", len(missing))
+    count("get_single_industry.calls", len(missing_industry))
+    workers = max(1, min(max_workers, len(missing) + len(missing_industry)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dmfm-fetch")
+    with span("fetch.per_symbol"):
+        try:
+            price_futures = {executor.submit(run, get_market_price, s): s for s in missing}
+            industry_futures = {executor.submit(run, get_single_industry, s): s for s in missing_industry}
+            tasks = {f: (get_market_price, s) for f, s in price_futures.items()}
+            tasks.update({f: (get_single_industry, s) for f, s in industry_futures.items()})
+            _wait_with_deadlines(tasks, started, workers, timeout)
+
+            for future, symbol in price_futures.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    prices[symbol] = future.result()
+                elif not future.done():
+                    print(f"Timeout fetching price for {symbol}")
+            for future, symbol in industry_futures.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    industries[symbol] = future.result()
+        finally:
+            # Không chờ các mã bị treo, để lần rerun sau lấy lại từ cache
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return prices, industries, stale
+
+
+def calculate_portfolio_metrics(curr_portfolio, max_workers: int = MAX_FETCH_WORKERS, timeout: float = FETCH_TIMEOUT):
     """Tính toán các chỉ số cho danh mục: lãi/lỗ, giá trung bình, giá hiện tại..."""
+    with span("metrics.fetch_market_data"):
+        prices, industries, stale = fetch_market_data(
+            [item["ma_cp"] for item in curr_portfolio], max_workers=max_workers, timeout=timeout
+        )
+    if not curr_portfolio:
+        return []
+    with span("metrics.compute"):
+        return _metric_rows(curr_portfolio, prices, industries, stale)
+
+
+def _metric_rows(curr_portfolio, prices, industries, stale):
+    """Ghép chỉ số dạng vector với record gốc thành các dòng hiển thị."""
+    frame = portfolio_frame(curr_portfolio, prices)
+
     rows = []
-    
-    for item in curr_portfolio:
+    for item, gia_von_avg, display_price, profit_pct in zip(
+        curr_portfolio,
+        frame["gia_von_avg"].tolist(),
+        frame["current_price"].tolist(),
+        frame["profit_pct"].tolist(),
+    ):
         ma_cp = item["ma_cp"]
-        market_price = get_market_price(ma_cp)
-        nganh = get_single_industry(ma_cp)
-        
-        # Giá vốn trung bình nếu mua 2 lần
-        gia_von_avg = item["gia_von"]
-        if item.get("gia_von_2"):
-            gia_von_avg = (item["gia_von"] + item["gia_von_2"]) / 2
-
-        if market_price:
-            profit_pct = (market_price - gia_von_avg) / gia_von_avg * 100
-            display_price = market_price
-        else:
-            profit_pct = 0.0
-            display_price = gia_von_avg
-
         rows.append({
             "id": item["id"],
             "ma_cp": ma_cp,
@@ -79,9 +386,10 @@ def calculate_portfolio_metrics(curr_portfolio):
             "gia_von_2": item.get("gia_von_2"),
             "gia_von_avg": gia_von_avg,
             "current_price": display_price,
+            "price_stale": ma_cp in stale,
             "profit_pct": profit_pct,
             "ty_trong": item.get("ty_trong", 0),
-            "nganh": nganh,
+            "nganh": industries.get(ma_cp, "—"),
             "raw_item": item # Keep original item for editing/deleting references
         })
         
@@ -91,22 +399,4 @@ def prepare_closed_positions_stats(curr_closed):
     """Tính toán thống kê cho các vị thế đã đóng."""
     if not curr_closed:
         return None
-        
-    chot_loi = [c for c in curr_closed if c["loai"] == "chot_loi"]
-    cat_lo = [c for c in curr_closed if c["loai"] == "cat_lo"]
-
-    total_closed = len(curr_closed)
-    win_rate = len(chot_loi) / total_closed * 100 if total_closed > 0 else 0
-    avg_profit = sum(c["profit_pct"] for c in chot_loi) / len(chot_loi) if chot_loi else 0
-    avg_loss = sum(c["profit_pct"] for c in cat_lo) / len(cat_lo) if cat_lo else 0
-    
-    return {
-        "total_closed": total_closed,
-        "chot_loi_count": len(chot_loi),
-        "cat_lo_count": len(cat_lo),
-        "win_rate": win_rate,
-        "avg_profit": avg_profit,
-        "avg_loss": avg_loss,
-        "chot_loi": chot_loi,
-        "cat_lo": cat_lo
-    }
+    return closed_stats(curr_closed)
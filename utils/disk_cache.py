@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Đường dẫn file cache mặc định (có thể đổi bằng biến môi trường DMFM_CACHE_PATH)
+DEFAULT_CACHE_PATH = os.getenv("DMFM_CACHE_PATH", ".cache/dmfm_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Mở connection SQLite ở chế độ WAL (nhiều process đọc đồng thời khi 1 process ghi)."""
+    conn = sqlite3.connect(path, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class DiskCache:
+    """Cache key/value trên SQLite, sống sót qua các lần restart server.
+
+    - Mỗi entry có TTL riêng (expires_at).
+    - Giới hạn số entry, vượt quá thì xóa entry ít được truy cập gần đây nhất (LRU gần đúng).
+    - Bật WAL để nhiều process Streamlit đọc đồng thời. Đọc không ghi gì vào file: thời điểm
+      truy cập được gom trong bộ nhớ của process và ghi xuống cùng lần ghi kế tiếp của chính
+      process đó (ngay trước khi dọn entry).
+    Giá trị được lưu dạng JSON.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # {key: thời điểm đọc gần nhất} chưa ghi xuống cột accessed_at
+        self._pending_access = {}
+        self._pending_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3.Connection không dùng chung giữa các luồng -> mỗi luồng 1 connection
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default=None, allow_expired: bool = False):
+        """Trả về giá trị còn hạn của key, hoặc default nếu không có / đã hết hạn.
+
+        allow_expired=True trả cả giá trị đã hết hạn (giá trị gần nhất đã biết).
+        """
+        now = time.time()
+        min_expiry = float("-inf") if allow_expired else now
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, min_expiry)
+            ).fetchone()
+            if row is None:
+                return default
+            self._note_access([key], now)
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Disk cache read error for {key}: {e}")
+            return default
+
+    def get_entries(self, keys) -> dict:
+        """Đọc nhiều key kể cả đã hết hạn: {key: (value, expires_at)}."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        try:
+            rows = self._conn().execute(
+                f"SELECT key, value, expires_at FROM cache WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            self._note_access([k for k, _, _ in rows], now)
+            return {k: (json.loads(v), exp) for k, v, exp in rows}
+        except sqlite3.Error as e:
+            print(f"Disk cache read error for {len(keys)} keys: {e}")
+            return {}
+
+    def set(self, key: str, value, ttl: float):
+        """Ghi 1 giá trị với thời gian sống ttl (giây)."""
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict, ttl: float):
+        """Ghi nhiều giá trị cùng TTL, sau đó dọn bớt entry nếu vượt giới hạn."""
+        if not items:
+            return
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                self._flush_access(conn)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(k, json.dumps(v), now + ttl, now) for k, v in items.items()],
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"Disk cache write error: {e}")
+
+    def delete(self, keys):
+        """Xóa các key chỉ định, không động tới các entry khác."""
+        keys = list(keys)
+        if not keys:
+            return
+        try:
+            with self._conn() as conn:
+                conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+        except sqlite3.Error as e:
+            print(f"Disk cache delete error: {e}")
+
+    def clear(self):
+        """Xóa toàn bộ cache."""
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            print(f"Disk cache clear error: {e}")
+
+    def _note_access(self, keys, now: float):
+        if keys:
+            with self._pending_lock:
+                self._pending_access.update(dict.fromkeys(keys, now))
+
+    def _flush_access(self, conn: sqlite3.Connection):
+        """Ghi các thời điểm đọc đang gom vào accessed_at (trong transaction ghi của người gọi)."""
+        with self._pending_lock:
+            pending, self._pending_access = self._pending_access, {}
+        if pending:
+            conn.executemany(
+                "UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(ts, k) for k, ts in pending.items()],
+            )
+
+    def _evict(self, conn: sqlite3.Connection):
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from utils.disk_cache import connect
+from utils.market_calendar import vn_now
+from utils.vnstock_gateway import gateway
+
+# Đường dẫn file lịch sử giá mặc định (có thể đổi bằng biến môi trường DMFM_HISTORY_PATH)
+DEFAULT_HISTORY_PATH = os.getenv("DMFM_HISTORY_PATH", ".cache/ohlcv.sqlite3")
+# Lần đầu gặp 1 mã thì tải lùi bao lâu (định dạng length của vnstock)
+INITIAL_LENGTH = "1M"
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+class HistoryStore:
+    """Kho nến ngày (OHLCV) trên SQLite, khóa theo (mã CP, ngày).
+
+    Mỗi lần cập nhật chỉ tải các nến từ ngày mới nhất đã lưu trở đi (nến của ngày đó
+    được ghi đè vì có thể là nến chưa chốt trong phiên). Giá lưu nguyên đơn vị vnstock
+    trả về (nghìn VND). Dùng chung cho mọi tính năng cần lịch sử giá.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ohlcv ("
+                " symbol TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " open REAL, high REAL, low REAL, close REAL, volume REAL,"
+                " PRIMARY KEY (symbol, date))"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def last_date(self, symbol: str) -> str | None:
+        """Ngày (YYYY-MM-DD) của nến mới nhất đã lưu, hoặc None nếu chưa có."""
+        row = self._conn().execute("SELECT MAX(date) FROM ohlcv WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0]
+
+    def last_close(self, symbol: str) -> float | None:
+        """Giá đóng cửa của nến mới nhất đã lưu (nghìn VND)."""
+        row = self._conn().execute(
+            "SELECT close FROM ohlcv WHERE symbol = ? ORDER BY date DESC LIMIT 1", (symbol,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def append(self, symbol: str, df: pd.DataFrame) -> int:
+        """Ghi (hoặc ghi đè) các nến trong DataFrame của vnstock, trả về số nến đã ghi."""
+        if df is None or df.empty:
+            return 0
+        dates = pd.to_datetime(df["time"]).dt.strftime("%Y-%m-%d")
+        records = [
+            (symbol, d, *(None if pd.isna(v) else float(v) for v in values))
+            for d, values in zip(dates, df[OHLCV_COLUMNS].itertuples(index=False, name=None))
+        ]
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ohlcv (symbol, date, open, high, low, close, volume)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+        return len(records)
+
+    def update(self, symbol: str) -> int:
+        """Tải từ vnstock các nến mới hơn dữ liệu đã lưu, trả về số nến đã ghi."""
+        last = self.last_date(symbol)
+        if last is None:
+            df = gateway.quote_history(symbol, length=INITIAL_LENGTH, interval="1D")
+        else:
+            df = gateway.quote_history(symbol, start=last, end=vn_now().strftime("%Y-%m-%d"), interval="1D")
+        return self.append(symbol, df)
+
+    def get_history(self, symbol: str, start: str = None, end: str = None) -> pd.DataFrame:
+        """Đọc nến đã lưu trong khoảng [start, end] (YYYY-MM-DD), không gọi vnstock."""
+        query = "SELECT date AS time, open, high, low, close, volume FROM ohlcv WHERE symbol = ?"
+        params = [symbol]
+        if start:
+            query += " AND date >= ?"
+            params.append(start)
+        if end:
+            query += " AND date <= ?"
+            params.append(end)
+        df = pd.read_sql_query(query + " ORDER BY date", self._conn(), params=params)
+        df["time"] = pd.to_datetime(df["time"])
+        return df
@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+# ============================================================
+# BACKEND LOCAL THAY SUPABASE (KIỂM THỬ TẢI / CHẠY OFFLINE)
+# ============================================================
+# Giả lập phần API supabase-py mà app dùng: table().select/insert/update/delete với
+# eq / in_ / order / limit / range, và rpc("sell_position"). Dữ liệu nằm trong bộ nhớ (dùng chung
+# cả tiến trình, giống 1 database), có thể nạp sẵn từ file JSON, có độ trễ giả lập và
+# đếm số lần gọi theo (bảng, thao tác).
+#
+# Bật bằng DMFM_BACKEND=local. Các biến môi trường khác:
+#   DMFM_LOCAL_SEED        file JSON {"portfolio": [...], "closed_positions": [...]}
+#   DMFM_LOCAL_LATENCY_MS  độ trễ mỗi request (ms), mặc định 0
+#   DMFM_LOCAL_JITTER_MS   dao động ngẫu nhiên thêm vào độ trễ (0..jitter ms), mặc định 0
+#   DMFM_LOCAL_MAX_ROWS    số dòng tối đa mỗi response SELECT (max-rows của PostgREST), mặc định 1000
+
+TABLES = ("portfolio", "closed_positions")
+CLOSED_COLUMNS = (
+    "ma_cp", "ngay_mua", "gia_von", "ngay_mua_2", "gia_von_2", "ty_trong",
+    "ngay_ban", "gia_ban", "profit_pct", "loai",
+)
+
+
+class LocalBackendError(Exception):
+    """Lỗi trả về từ backend local (tương ứng lỗi PostgREST / Postgres)."""
+
+
+class LocalQuery:
+    """1 truy vấn trên 1 bảng, dựng theo kiểu chuỗi như postgrest-py."""
+
+    def __init__(self, client: "LocalClient", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._payload = None
+        self._columns = None
+        self._filters = []
+        self._order = None
+        self._offset = 0
+        self._limit = None
+
+    def select(self, columns: str = "*"):
+        self._op = "select"
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, data):
+        self._op = "insert"
+        self._payload = data if isinstance(data, list) else [data]
+        return self
+
+    def update(self, data: dict):
+        self._op = "update"
+        self._payload = data
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def range(self, start: int, end: int):
+        """Dòng thứ start..end (tính cả end), như header Range của PostgREST."""
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def _matches(self, row: dict) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def execute(self):
+        return SimpleNamespace(data=self._client._execute(self))
+
+
+class LocalRpc:
+    def __init__(self, client: "LocalClient", name: str, params: dict):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        return SimpleNamespace(data=self._client._call_rpc(self._name, self._params))
+
+
+class LocalClient:
+    """Client thay cho supabase.Client, dữ liệu trong bộ nhớ."""
+
+    def __init__(self, seed: dict = None, latency_ms: float = 0.0, jitter_ms: float = 0.0, max_rows: int = 1000):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_rows = max_rows
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._rows = {t: [] for t in TABLES}
+        self._next_id = {t: 1 for t in TABLES}
+        if seed:
+            self.load(seed)
+
+    # ---------- Dữ liệu ----------
+    def load(self, seed: dict):
+        """Thay toàn bộ dữ liệu bằng seed {bảng: [records]} (record không có id sẽ được cấp id)."""
+        with self._lock:
+            for table in TABLES:
+                self._rows[table] = []
+                self._next_id[table] = 1
+                for row in seed.get(table, []):
+                    self._insert_row(table, row)
+
+    def snapshot(self) -> dict:
+        """Bản sao dữ liệu hiện tại {bảng: [records]}."""
+        with self._lock:
+            return {t: [dict(r) for r in rows] for t, rows in self._rows.items()}
+
+    def _insert_row(self, table: str, data: dict) -> dict:
+        row = dict(data)
+        if row.get("id") is None:
+            row["id"] = self._next_id[table]
+        self._next_id[table] = max(self._next_id[table], row["id"] + 1)
+        self._rows[table].append(row)
+        return row
+
+    # ---------- API kiểu supabase-py ----------
+    def table(self, name: str) -> LocalQuery:
+        if name not in self._rows:
+            raise LocalBackendError(f'relation "{name}" does not exist')
+        return LocalQuery(self, name)
+
+    def rpc(self, name: str, params: dict = None) -> LocalRpc:
+        return LocalRpc(self, name, params or {})
+
+    def _sleep(self):
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _execute(self, q: LocalQuery) -> list:
+        self._sleep()
+        self.calls[(q._table, q._op)] += 1
+        with self._lock:
+            rows = self._rows[q._table]
+            if q._op == "insert":
+                return [dict(self._insert_row(q._table, r)) for r in q._payload]
+
+            matched = [r for r in rows if q._matches(r)]
+            if q._op == "update":
+                for r in matched:
+                    r.update(q._payload)
+            elif q._op == "delete":
+                matched_ids = {id(r) for r in matched}
+                self._rows[q._table] = [r for r in rows if id(r) not in matched_ids]
+            else:
+                if q._order:
+                    column, desc = q._order
+                    matched = sorted(matched, key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+                if q._offset or q._limit is not None:
+                    end = None if q._limit is None else q._offset + q._limit
+                    matched = matched[q._offset:end]
+                if self.max_rows:
+                    # PostgREST cắt response ở max-rows mà không báo lỗi
+                    matched = matched[:self.max_rows]
+                if q._columns:
+                    return [{c: r.get(c) for c in q._columns} for r in matched]
+            return [dict(r) for r in matched]
+
+    def _call_rpc(self, name: str, params: dict):
+        self._sleep()
+        self.calls[("rpc", name)] += 1
+        if name != "sell_position":
+            raise LocalBackendError(f"function {name} does not exist")
+        # Cùng ngữ nghĩa với sql/sell_position.sql: xóa vị thế + thêm giao dịch đã đóng
+        # trong 1 lần khóa, trả về danh mục + lịch sử đã đóng của tab
+        with self._lock:
+            item_id = params["p_item_id"]
+            pos = next((r for r in self._rows["portfolio"] if r["id"] == item_id), None)
+            if pos is None:
+                raise LocalBackendError(f"Vị thế {item_id} không tồn tại")
+            self._rows["portfolio"] = [r for r in self._rows["portfolio"] if r is not pos]
+            closed = {c: params["p_closed"].get(c) for c in CLOSED_COLUMNS}
+            closed["tab_id"] = pos["tab_id"]
+            self._insert_row("closed_positions", closed)
+            return {
+                "portfolio": [dict(r) for r in self._rows["portfolio"] if r["tab_id"] == pos["tab_id"]],
+                "closed": [dict(r) for r in self._rows["closed_positions"] if r["tab_id"] == pos["tab_id"]],
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_local_client() -> LocalClient:
+    """Client local dùng chung cả tiến trình (dữ liệu giữ nguyên giữa các lần rerun)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            seed = None
+            seed_path = os.getenv("DMFM_LOCAL_SEED")
+            if seed_path:
+                with open(seed_path, encoding="utf-8") as f:
+                    seed = json.load(f)
+            _client = LocalClient(
+                seed=seed,
+                latency_ms=float(os.getenv("DMFM_LOCAL_LATENCY_MS", "0")),
+                jitter_ms=float(os.getenv("DMFM_LOCAL_JITTER_MS", "0")),
+                max_rows=int(os.getenv("DMFM_LOCAL_MAX_ROWS", "1000")),
+            )
+        return _client
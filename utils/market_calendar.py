@@ -0,0 +1,115 @@
+from datetime import datetime, date, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+# ============================================================
+# LỊCH GIAO DỊCH HOSE
+# ============================================================
+VN_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+
+# Phiên sáng (ATO + khớp lệnh liên tục) và phiên chiều (khớp lệnh liên tục + ATC + thỏa thuận)
+TRADING_SESSIONS = [
+    (dtime(9, 0), dtime(11, 30)),
+    (dtime(13, 0), dtime(15, 0)),
+]
+
+# Ngày nghỉ lễ rơi vào ngày thường (thứ 2 - thứ 6), theo thông báo lịch nghỉ của HOSE.
+# Cần bổ sung mỗi năm khi HOSE công bố lịch nghỉ mới; với năm sau năm cuối cùng trong bảng,
+# is_trading_day in cảnh báo và chỉ nghỉ thứ 7 / chủ nhật.
+HOLIDAYS = {
+    # 2025
+    date(2025, 1, 1),
+    date(2025, 1, 27), date(2025, 1, 28), date(2025, 1, 29), date(2025, 1, 30), date(2025, 1, 31),
+    date(2025, 4, 7),
+    date(2025, 4, 30), date(2025, 5, 1), date(2025, 5, 2),
+    date(2025, 9, 1), date(2025, 9, 2),
+    # 2026
+    date(2026, 1, 1),
+    date(2026, 2, 16), date(2026, 2, 17), date(2026, 2, 18), date(2026, 2, 19), date(2026, 2, 20),
+    date(2026, 4, 27),
+    date(2026, 4, 30), date(2026, 5, 1),
+    date(2026, 9, 1), date(2026, 9, 2),
+    # 2027 (tạm tính theo Bộ luật Lao động + âm lịch, đối chiếu lại khi HOSE công bố):
+    # Tết Đinh Mùi 30 tháng Chạp - mùng 4 (05-09/02, nghỉ bù 10-11/02 cho thứ 7 / chủ nhật),
+    # Giỗ Tổ 10/3 âm lịch = 16/04, 30/4 + 1/5 (thứ 7, nghỉ bù 03/05), Quốc khánh 02-03/09
+    date(2027, 1, 1),
+    date(2027, 2, 5), date(2027, 2, 8), date(2027, 2, 9), date(2027, 2, 10), date(2027, 2, 11),
+    date(2027, 4, 16),
+    date(2027, 4, 30), date(2027, 5, 3),
+    date(2027, 9, 2), date(2027, 9, 3),
+}
+# Năm cuối cùng đã có lịch nghỉ lễ trong HOLIDAYS
+HOLIDAYS_LAST_YEAR = max(d.year for d in HOLIDAYS)
+_warned_years = set()
+
+# TTL giá trong phiên (giây); ngoài phiên giá không đổi nên cache tới phiên kế tiếp
+INTRADAY_PRICE_TTL = 60
+MIN_PRICE_TTL = 60
+
+
+def vn_now() -> datetime:
+    """Thời điểm hiện tại theo giờ Việt Nam."""
+    return datetime.now(VN_TZ)
+
+
+def has_holiday_table(year: int) -> bool:
+    """True nếu HOLIDAYS đã có lịch nghỉ lễ của năm year."""
+    return year <= HOLIDAYS_LAST_YEAR
+
+
+def is_trading_day(now: datetime = None) -> bool:
+    """True nếu là ngày giao dịch (thứ 2 - thứ 6, không phải ngày nghỉ lễ).
+
+    Năm chưa có trong HOLIDAYS: cảnh báo (1 lần / năm) và chỉ coi thứ 7 / chủ nhật là ngày nghỉ.
+    """
+    now = now or vn_now()
+    if not has_holiday_table(now.year):
+        if now.year not in _warned_years:
+            _warned_years.add(now.year)
+            print(f"Cảnh báo: HOLIDAYS chưa có lịch nghỉ lễ năm {now.year}, chỉ nghỉ thứ 7 / chủ nhật")
+        return now.weekday() < 5
+    return now.weekday() < 5 and now.date() not in HOLIDAYS
+
+
+def is_trading_session(now: datetime = None) -> bool:
+    """True nếu đang trong phiên giao dịch HOSE (không tính nghỉ trưa)."""
+    now = now or vn_now()
+    if not is_trading_day(now):
+        return False
+    t = now.timetz().replace(tzinfo=None)
+    return any(start <= t < end for start, end in TRADING_SESSIONS)
+
+
+def next_session_open(now: datetime = None) -> datetime:
+    """Thời điểm mở phiên giao dịch kế tiếp sau now (giờ Việt Nam)."""
+    now = (now or vn_now()).astimezone(VN_TZ)
+    day = now.date()
+    for _ in range(30):
+        candidate = datetime.combine(day, dtime(), VN_TZ)
+        if is_trading_day(candidate):
+            for start, _end in TRADING_SESSIONS:
+                open_at = datetime.combine(day, start, VN_TZ)
+                if open_at > now:
+                    return open_at
+        day += timedelta(days=1)
+    # Không tìm thấy trong 30 ngày (lịch nghỉ bất thường): coi như mở lại ngày mai
+    return datetime.combine(now.date() + timedelta(days=1), TRADING_SESSIONS[0][0], VN_TZ)
+
+
+def price_ttl(now: datetime = None) -> float:
+    """TTL (giây) cho giá vừa lấy: ngắn trong phiên, ngoài phiên thì tới lúc mở phiên kế tiếp."""
+    now = now or vn_now()
+    if is_trading_session(now):
+        return INTRADAY_PRICE_TTL
+    return max(MIN_PRICE_TTL, (next_session_open(now) - now).total_seconds())
+
+
+def describe_price_cache_policy(now: datetime = None) -> str:
+    """Mô tả chính sách cache giá hiện tại để hiển thị ở chân trang."""
+    now = now or vn_now()
+    if is_trading_session(now):
+        policy = f"Giá được cache {INTRADAY_PRICE_TTL} giây trong phiên"
+    else:
+        policy = f"Ngoài phiên, giá được cache tới {next_session_open(now).strftime('%H:%M %d/%m/%Y')}"
+    if not has_holiday_table(now.year):
+        policy += f" (chưa có lịch nghỉ lễ năm {now.year})"
+    return policy
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any
+
+# ============================================================
+# TÍNH CHỈ SỐ DANH MỤC DẠNG VECTOR (PANDAS / NUMPY)
+# ============================================================
+# Cùng công thức với cách tính từng dòng trước đây, nhưng tính trên cả cột một lần
+# nên danh mục hàng nghìn vị thế vẫn chỉ mất vài mili giây.
+
+
+def _numeric(values) -> np.ndarray:
+    """Chuyển 1 cột về float, giá trị rỗng / không hợp lệ thành NaN."""
+    try:
+        # Nhanh: numpy tự đổi None thành NaN và chuỗi số thành float
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").to_numpy(dtype=float)
+
+
+def portfolio_frame(curr_portfolio: List[Dict[str, Any]], prices: Dict[str, float]) -> pd.DataFrame:
+    """Bảng chỉ số cho danh mục với vector giá thị trường prices {mã CP: giá VND}.
+
+    Cột: ma_cp, gia_von_avg, market_price, current_price, profit_pct, ty_trong.
+    - gia_von_avg: trung bình 2 lần mua nếu có giá vốn lần 2, ngược lại là giá vốn lần 1.
+    - Mã không có giá (None / 0): current_price = gia_von_avg, profit_pct = 0.
+    """
+    ma_cp = [item["ma_cp"] for item in curr_portfolio]
+    gia_von = _numeric([item["gia_von"] for item in curr_portfolio])
+    gia_von_2 = _numeric([item.get("gia_von_2") for item in curr_portfolio])
+    market = _numeric([prices.get(s) for s in ma_cp])
+
+    has_buy2 = np.nan_to_num(gia_von_2) != 0
+    gia_von_avg = np.where(has_buy2, (gia_von + np.nan_to_num(gia_von_2)) / 2, gia_von)
+
+    has_price = np.nan_to_num(market) != 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_pct = np.where(has_price, (market - gia_von_avg) / gia_von_avg * 100, 0.0)
+    current_price = np.where(has_price, market, gia_von_avg)
+
+    return pd.DataFrame({
+        "ma_cp": ma_cp,
+        "gia_von_avg": gia_von_avg,
+        "market_price": market,
+        "current_price": current_price,
+        "profit_pct": profit_pct,
+        "ty_trong": np.nan_to_num(_numeric([item.get("ty_trong", 0) for item in curr_portfolio])),
+    })
+
+
+def portfolio_totals(frame: pd.DataFrame) -> Dict[str, Any]:
+    """Tổng hợp toàn danh mục từ portfolio_frame: số mã, tổng tỷ trọng, lợi nhuận TB / theo tỷ trọng."""
+    total_weight = float(frame["ty_trong"].sum())
+    profit = frame["profit_pct"].to_numpy()
+    return {
+        "total_positions": int(len(frame)),
+        "total_weight": total_weight,
+        "avg_profit_pct": float(profit.mean()) if len(frame) else 0.0,
+        "weighted_profit_pct": float((profit * frame["ty_trong"].to_numpy()).sum() / total_weight) if total_weight else 0.0,
+    }
+
+
+def closed_stats(curr_closed: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Thống kê vị thế đã đóng trong 1 lượt: số lệnh chốt lời / cắt lỗ, win rate, lãi / lỗ TB."""
+    loai = np.array([c["loai"] for c in curr_closed], dtype=object)
+    profit = _numeric([c["profit_pct"] for c in curr_closed])
+    is_win = loai == "chot_loi"
+    is_loss = loai == "cat_lo"
+
+    total_closed = len(curr_closed)
+    win_count = int(is_win.sum())
+    loss_count = int(is_loss.sum())
+    return {
+        "total_closed": total_closed,
+        "chot_loi_count": win_count,
+        "cat_lo_count": loss_count,
+        "win_rate": win_count / total_closed * 100 if total_closed > 0 else 0,
+        "avg_profit": float(profit[is_win].mean()) if win_count else 0,
+        "avg_loss": float(profit[is_loss].mean()) if loss_count else 0,
+        "chot_loi": [c for c, w in zip(curr_closed, is_win) if w],
+        "cat_lo": [c for c, l in zip(curr_closed, is_loss) if l],
+    }
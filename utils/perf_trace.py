@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# ============================================================
+# ĐO THỜI GIAN TỪNG LẦN RERUN
+# ============================================================
+# Mỗi lần chạy script (1 phiên trình duyệt) có 1 trace: các span (tên, bắt đầu, thời lượng)
+# và bộ đếm hit / miss của cache. Trace được tìm theo ScriptRunContext nên luồng con đã gắn
+# context (thread pool lấy giá) cũng ghi vào đúng trace. Khi không có trace (chạy ngoài
+# Streamlit, fragment rerun) thì span / count không làm gì. Trace do st.session_state giữ;
+# bảng tra theo session chỉ giữ tham chiếu yếu nên phiên đóng thì trace được giải phóng.
+#
+# Cuối mỗi lần chạy, trace được ghi thêm 1 dòng JSON vào DMFM_PERF_LOG
+# (mặc định .cache/perf.jsonl; đặt rỗng để tắt), xoay vòng khi quá PERF_LOG_MAX_BYTES.
+
+DEFAULT_PERF_LOG = os.getenv("DMFM_PERF_LOG", ".cache/perf.jsonl")
+PERF_LOG_MAX_BYTES = 20 * 1024 * 1024
+
+
+class RunTrace:
+    """Span + bộ đếm của 1 lần chạy script."""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = []
+        self.counters = Counter()
+        self.total_ms = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: float, depth: int = 0):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "depth": depth,
+                "start_ms": round((start - self._t0) * 1000, 2),
+                "ms": round((end - start) * 1000, 2),
+                "thread": threading.current_thread().name,
+            })
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def unattributed_ms(self) -> float:
+        """Thời gian của lần chạy không nằm trong span ngoài cùng nào của luồng script
+        (dựng widget, layout, code chưa đo)."""
+        main = threading.current_thread().name
+        covered = sum(sp["ms"] for sp in self.spans if sp["depth"] == 0 and sp["thread"] == main)
+        return round((self.total_ms or 0) - covered, 2)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "ts": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+                "label": self.label,
+                "total_ms": self.total_ms,
+                "unattributed_ms": self.unattributed_ms(),
+                "spans": list(self.spans),
+                "counters": dict(self.counters),
+            }
+
+
+_traces = weakref.WeakValueDictionary()
+_traces_lock = threading.Lock()
+_log_lock = threading.Lock()
+# Độ sâu lồng nhau của span trên từng luồng (span ngoài cùng có depth 0)
+_depth = threading.local()
+
+
+def _session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def start_run(label: str = "") -> RunTrace:
+    """Bắt đầu trace mới cho lần chạy script hiện tại của phiên.
+
+    Người gọi phải giữ tham chiếu tới trace (VD: trong st.session_state) cho tới finish_run.
+    """
+    trace = RunTrace(label)
+    sid = _session_id()
+    if sid is not None:
+        with _traces_lock:
+            _traces[sid] = trace
+    return trace
+
+
+def current_trace():
+    """Trace đang mở của phiên hiện tại (None nếu không có hoặc đã kết thúc)."""
+    sid = _session_id()
+    if sid is None:
+        return None
+    trace = _traces.get(sid)
+    return trace if trace is not None and trace.total_ms is None else None
+
+
+@contextmanager
+def span(name: str):
+    """Đo thời gian 1 đoạn code và ghi vào trace hiện tại."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    depth = getattr(_depth, "value", 0)
+    _depth.value = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _depth.value = depth
+        trace.add_span(name, start, time.perf_counter(), depth)
+
+
+def count(name: str, n: int = 1):
+    """Tăng bộ đếm (VD: cache hit / miss) trong trace hiện tại."""
+    trace = current_trace()
+    if trace is not None:
+        trace.count(name, n)
+
+
+def finish_run(trace: RunTrace, log_path: str = DEFAULT_PERF_LOG) -> dict:
+    """Kết thúc trace và ghi 1 dòng JSON vào log; trả về trace dạng dict."""
+    trace.finish()
+    record = trace.to_dict()
+    if log_path:
+        try:
+            path = Path(log_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with _log_lock:
+                if path.exists() and path.stat().st_size > PERF_LOG_MAX_BYTES:
+                    path.replace(path.with_name(path.name + ".1"))
+                with path.open("a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"Perf log write error: {e}")
+    return record
+
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+
+class CircuitOpenError(Exception):
+    """Nguồn dữ liệu đang bị ngắt mạch (circuit breaker mở), không gọi tới nguồn."""
+
+
+class NoDataError(LookupError):
+    """Nguồn trả lời bình thường nhưng không có dữ liệu cho yêu cầu (VD: mã sai / đã hủy niêm yết).
+
+    Là kết quả của riêng yêu cầu đó, không phải lỗi của nguồn: không retry, không tính là lỗi cho breaker.
+    """
+
+
+class CircuitBreaker:
+    """Ngắt mạch theo từng nguồn dữ liệu vnstock.
+
+    Sau failure_threshold lần lỗi liên tiếp, breaker chuyển sang "open" trong cooldown giây:
+    mọi lời gọi bị từ chối ngay (CircuitOpenError) thay vì chờ retry. Hết cooldown thì cho
+    1 lời gọi thử ("half_open"); thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.total_calls = 0
+        self.total_failures = 0
+        self.total_retries = 0
+        self.total_rejected = 0
+        self.last_error = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """True nếu được phép gọi tới nguồn dữ liệu."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.total_calls += 1
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.total_calls += 1
+            self.total_failures += 1
+            self.last_error = str(error)
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_retry(self):
+        with self._lock:
+            self.total_retries += 1
+
+    def status(self) -> dict:
+        """Ảnh chụp trạng thái hiện tại để hiển thị / ghi log."""
+        with self._lock:
+            state = self._state()
+            reopen_in = 0.0
+            if state == "open":
+                reopen_in = self.cooldown - (time.monotonic() - self._opened_at)
+            return {
+                "source": self.name,
+                "state": state,
+                "consecutive_failures": self._failures,
+                "reopen_in": round(reopen_in, 1),
+                "calls": self.total_calls,
+                "failures": self.total_failures,
+                "retries": self.total_retries,
+                "rejected": self.total_rejected,
+                "last_error": self.last_error,
+            }
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry với exponential backoff + full jitter."""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 4.0
+
+    def delay(self, attempt: int) -> float:
+        """Thời gian chờ (giây) trước lần thử thứ attempt + 1 (attempt bắt đầu từ 0)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, breaker: CircuitBreaker = None):
+        """Gọi fn() theo chính sách retry, báo kết quả cho breaker (nếu có).
+
+        Raise CircuitOpenError ngay khi breaker đang mở, hoặc lỗi cuối cùng khi hết số lần thử.
+        NoDataError được raise lại ngay: nguồn vẫn trả lời được nên breaker coi là thành công.
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(f"Nguồn {breaker.name} đang tạm ngắt") from last_error
+            try:
+                result = fn()
+            except NoDataError:
+                if breaker is not None:
+                    # Giải phóng lượt thử half_open và reset chuỗi lỗi liên tiếp của nguồn
+                    breaker.record_success()
+                raise
+            except Exception as e:
+                last_error = e
+                if breaker is not None:
+                    breaker.record_failure(e)
+                if attempt < self.max_attempts - 1:
+                    if breaker is not None:
+                        breaker.record_retry()
+                    time.sleep(self.delay(attempt))
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        raise last_error
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(source: str, failure_threshold: int = 5, cooldown: float = 60) -> CircuitBreaker:
+    """Lấy (hoặc tạo) circuit breaker dùng chung cho 1 nguồn dữ liệu trong process."""
+    with _breakers_lock:
+        if source not in _breakers:
+            _breakers[source] = CircuitBreaker(source, failure_threshold, cooldown)
+        return _breakers[source]
+
+
+def get_resilience_status() -> list:
+    """Trạng thái của tất cả breaker đã tạo."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.status() for b in breakers]
+
+
+def degraded_sources() -> list:
+    """Tên các nguồn đang bị ngắt mạch (open / half_open)."""
+    return [s["source"] for s in get_resilience_status() if s["state"] != "closed"]
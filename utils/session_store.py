@@ -0,0 +1,43 @@
+import streamlit as st
+from typing import List, Dict, Any, Callable
+
+# ============================================================
+# SESSION STORE - CẬP NHẬT DỮ LIỆU LOCAL SAU KHI GHI SUPABASE
+# ============================================================
+# Supabase trả về các dòng vừa insert/update/delete, nên có thể áp thay đổi trực tiếp
+# vào st.session_state thay vì select("*") lại cả bảng. Nếu Supabase không trả về dòng
+# nào (dòng đã bị xóa/sửa ở nơi khác) thì coi là xung đột và tải lại toàn bộ.
+# Danh sách luôn được thay bằng list mới (không sửa tại chỗ), và mỗi lần thay đổi
+# đều tăng bộ đếm phiên bản để các kết quả tính toán có thể được ghi nhớ theo phiên bản.
+
+
+def get_version(state_key: str) -> int:
+    """Phiên bản hiện tại của danh sách state_key (tăng sau mỗi lần thay đổi)."""
+    return st.session_state.get(f"{state_key}__version", 0)
+
+
+def replace_rows(state_key: str, rows: List[Dict[str, Any]]):
+    """Thay toàn bộ danh sách trong session và tăng phiên bản."""
+    st.session_state[state_key] = rows
+    st.session_state[f"{state_key}__version"] = get_version(state_key) + 1
+
+
+def apply_upsert(state_key: str, returned_rows: List[Dict[str, Any]], reload: Callable[[], List[Dict[str, Any]]]):
+    """Thêm mới hoặc thay thế (theo id) các dòng Supabase trả về vào danh sách trong session."""
+    if not returned_rows:
+        replace_rows(state_key, reload())
+        return
+    by_id = {r["id"]: r for r in returned_rows}
+    current = st.session_state.get(state_key, [])
+    updated = [by_id.pop(r["id"], r) for r in current]
+    replace_rows(state_key, updated + list(by_id.values()))
+
+
+def apply_delete(state_key: str, returned_rows: List[Dict[str, Any]], reload: Callable[[], List[Dict[str, Any]]]):
+    """Bỏ các dòng Supabase báo đã xóa khỏi danh sách trong session."""
+    if not returned_rows:
+        replace_rows(state_key, reload())
+        return
+    deleted_ids = {r["id"] for r in returned_rows}
+    current = st.session_state.get(state_key, [])
+    replace_rows(state_key, [r for r in current if r["id"] not in deleted_ids])
@@ -1,79 +1,145 @@
 import streamlit as st
-import base64
 from pathlib import Path
 from datetime import datetime, date
+from functools import lru_cache
 from typing import List, Dict, Any
 
 # Utils
 from utils.data_processing import calculate_portfolio_metrics, prepare_closed_positions_stats, get_market_price
 
+# Logo phục vụ qua static file serving (thư mục static/ cạnh DMFM.py)
+STATIC_LOGO_PATH = Path(__file__).resolve().parent.parent / "static" / "logo.png"
+STATIC_LOGO_URL = "app/static/logo.png"
+
+# ============================================================
+# TEMPLATE & CACHE HTML TỪNG DÒNG
+# ============================================================
+# HTML của mỗi dòng (trừ cột STT) được cache theo nội dung dòng, nên khi chỉ vài dòng
+# đổi (giá mới, thêm / bán 1 vị thế) thì chỉ các dòng đó phải định dạng lại.
+# STT nằm ngoài phần được cache để chèn / xóa 1 dòng không làm mất cache các dòng sau.
+ROW_CACHE_SIZE = 8192
+
+_PORTFOLIO_TABLE = (
+    '<div class="glass-card"><table class="portfolio-table">'
+    '<thead><tr><th>STT</th><th>Ngày mua</th><th>Mã cổ phiếu</th>'
+    '<th>Giá vốn</th><th>Giá thị trường</th><th>% Lợi nhuận</th>'
+    '{ty_trong_th}<th>Ngành</th></tr></thead>'
+    '<tbody>{body}</tbody></table></div>'
+)
+_PORTFOLIO_ROW = (
+    '<td>{ngay}</td><td class="symbol">{ma_cp}</td><td>{gia_von}</td>'
+    '<td>{gia_tt}</td><td>{profit}</td>{ty_trong_td}<td>{nganh}</td>'
+)
+_CLOSED_TABLE = (
+    '<div class="glass-card"><table class="portfolio-table">'
+    '<thead><tr><th>STT</th><th>Mã CP</th><th>Ngày mua</th>'
+    '<th>Giá vốn</th><th>Ngày bán</th><th>Giá bán</th>'
+    '<th>% Lợi nhuận</th><th>Loại</th></tr></thead>'
+    '<tbody>{body}</tbody></table></div>'
+)
+_CLOSED_ROW = (
+    '<td class="symbol">{ma_cp}</td><td>{ngay_mua}</td><td>{gia_von}</td>'
+    '<td>{ngay_ban}</td><td>{gia_ban}</td><td>{profit}</td><td>{loai}</td>'
+)
+_STALE_BADGE = ' <span class="price-stale" title="Giá cũ, đang cập nhật">⏳</span>'
+_LOAI_BADGE = {
+    "chot_loi": '<span style="background:#2E7D32;color:#fff;padding:2px 8px;border-radius:8px;font-size:0.75rem;">Chốt lời</span>',
+    "cat_lo": '<span style="background:#C62828;color:#fff;padding:2px 8px;border-radius:8px;font-size:0.75rem;">Cắt lỗ</span>',
+}
+
+
+@lru_cache(maxsize=4096)
+def _fmt_date(iso: str) -> str:
+    """YYYY-MM-DD -> DD/MM/YYYY."""
+    return datetime.strptime(iso, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+
+def _fmt_price(value) -> str:
+    """Format a VND price with dot thousands separators."""
+    return f"{value:,.0f}".replace(",", ".")
+
+
+def _profit_html(p) -> str:
+    """Colored ▲ / ▼ profit badge."""
+    if p >= 0:
+        return f'<span class="profit-positive">▲ +{p:.2f}%</span>'
+    return f'<span class="profit-negative">▼ {p:.2f}%</span>'
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _portfolio_row_cells(ngay_mua, ngay_mua_2, ma_cp, gia_von_avg, current_price,
+                         price_stale, profit_pct, ty_trong, nganh, show_weight) -> str:
+    """Cells of one portfolio row after the STT column."""
+    ngay = _fmt_date(ngay_mua)
+    if ngay_mua_2:
+        ngay += "<br>" + _fmt_date(ngay_mua_2)
+    gia_tt = _fmt_price(current_price)
+    if price_stale:
+        # Giá cũ đang được làm mới ở luồng nền
+        gia_tt += _STALE_BADGE
+    return _PORTFOLIO_ROW.format(
+        ngay=ngay, ma_cp=ma_cp, gia_von=_fmt_price(gia_von_avg), gia_tt=gia_tt,
+        profit=_profit_html(profit_pct), nganh=nganh,
+        ty_trong_td=f'<td>{ty_trong}%</td>' if show_weight else "",
+    )
+
+
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def _closed_row_cells(ma_cp, ngay_mua, gia_von, gia_von_2, ngay_ban, gia_ban, profit_pct, loai) -> str:
+    """Cells of one closed-position row after the STT column."""
+    if gia_von_2:
+        gia_von = (gia_von + gia_von_2) / 2
+    return _CLOSED_ROW.format(
+        ma_cp=ma_cp, ngay_mua=_fmt_date(ngay_mua), gia_von=_fmt_price(gia_von),
+        ngay_ban=_fmt_date(ngay_ban), gia_ban=_fmt_price(gia_ban),
+        profit=_profit_html(profit_pct), loai=_LOAI_BADGE.get(loai, _LOAI_BADGE["cat_lo"]),
+    )
+
+
 def render_header(tab_id: str):
-    """Render the application header with optional logo."""
-    LOGO_PATH = Path("logo.png")
-    logo_b64 = ""
-    if LOGO_PATH.exists() and tab_id == "tab1":
-        logo_b64 = base64.b64encode(LOGO_PATH.read_bytes()).decode()
-
-    if logo_b64:
-        header_html = f"""
-        <div class="main-header">
-            <img src="data:image/png;base64,{logo_b64}" class="logo-img" alt="KAFI SAIGON">
-            <h1>BÁO CÁO DANH MỤC ĐẦU TƯ</h1>
-            <div class="sub">Cập nhật ngày {datetime.now().strftime("%d/%m/%Y")}</div>
-            <div class="divider"></div>
-        </div>
-        """
-    else:
-        header_html = f"""
-        <div class="main-header">
-            <h1>BÁO CÁO DANH MỤC ĐẦU TƯ</h1>
-            <div class="sub">Cập nhật ngày {datetime.now().strftime("%d/%m/%Y")}</div>
-            <div class="divider"></div>
-        </div>
-        """
+    """Render the application header with optional logo.
+
+    The logo is served from static/logo.png (resized copy of logo.png) through
+    Streamlit static file serving, so the browser caches it instead of receiving
+    it inline on every rerun.
+    """
+    logo_html = ""
+    if tab_id == "tab1" and STATIC_LOGO_PATH.exists():
+        logo_html = f'<img src="{STATIC_LOGO_URL}" class="logo-img" alt="KAFI SAIGON">'
+
+    header_html = f"""
+    <div class="main-header">{logo_html}
+        <h1>BÁO CÁO DANH MỤC ĐẦU TƯ</h1>
+        <div class="sub">Cập nhật ngày {datetime.now().strftime("%d/%m/%Y")}</div>
+        <div class="divider"></div>
+    </div>
+    """
     st.markdown(header_html, unsafe_allow_html=True)
 
+def build_portfolio_table_html(rows: List[Dict[str, Any]], tab_id: str) -> str:
+    """Build the HTML table for the portfolio."""
+    show_weight = tab_id == "tab1"
+    body = "".join(
+        f'<tr><td>{i}</td>'
+        + _portfolio_row_cells(
+            r["ngay_mua"], r.get("ngay_mua_2"), r["ma_cp"], r["gia_von_avg"], r["current_price"],
+            bool(r.get("price_stale")), r["profit_pct"], r["ty_trong"], r["nganh"], show_weight,
+        )
+        + '</tr>'
+        for i, r in enumerate(rows, 1)
+    )
+    return _PORTFOLIO_TABLE.format(ty_trong_th='<th>Tỷ trọng</th>' if show_weight else "", body=body)
+
+
 def render_portfolio_table(rows: List[Dict[str, Any]], tab_id: str):
     """Render the HTML table for the portfolio."""
-    table_rows_html = ""
-    for r in rows:
-        ngay_display = datetime.strptime(r["ngay_mua"], "%Y-%m-%d").strftime("%d/%m/%Y")
-        if r.get("ngay_mua_2"):
-            ngay_display += "<br>" + datetime.strptime(r["ngay_mua_2"], "%Y-%m-%d").strftime("%d/%m/%Y")
-
-        gia_von_fmt = f"{r['gia_von_avg']:,.0f}".replace(",", ".")
-        gia_tt_fmt = f"{r['current_price']:,.0f}".replace(",", ".")
-        p = r["profit_pct"]
-        if p >= 0:
-            p_cls = "profit-positive"
-            p_icon = "▲"
-            p_sign = "+"
-        else:
-            p_cls = "profit-negative"
-            p_icon = "▼"
-            p_sign = ""
-        profit_display = f'<span class="{p_cls}">{p_icon} {p_sign}{p:.2f}%</span>'
-
-        ty_trong_td = f'<td>{r["ty_trong"]}%</td>' if tab_id == "tab1" else ""
-        table_rows_html += (f'<tr><td>{rows.index(r)+1}</td>'
-                            f'<td>{ngay_display}</td>'
-                            f'<td class="symbol">{r["ma_cp"]}</td><td>{gia_von_fmt}</td>'
-                            f'<td>{gia_tt_fmt}</td><td>{profit_display}</td>'
-                            f'{ty_trong_td}<td>{r["nganh"]}</td></tr>')
-
-    ty_trong_th = '<th>Tỷ trọng</th>' if tab_id == "tab1" else ""
-    table_html = ('<div class="glass-card"><table class="portfolio-table">'
-                  '<thead><tr><th>STT</th><th>Ngày mua</th><th>Mã cổ phiếu</th>'
-                  '<th>Giá vốn</th><th>Giá thị trường</th><th>% Lợi nhuận</th>'
-                  f'{ty_trong_th}<th>Ngành</th></tr></thead>'
-                  f'<tbody>{table_rows_html}</tbody></table></div>')
-    st.markdown(table_html, unsafe_allow_html=True)
+    st.markdown(build_portfolio_table_html(rows, tab_id), unsafe_allow_html=True)
 
 
-def render_closed_stats(stats: Dict[str, Any]):
-    """Render top statistics for closed positions."""
+def build_closed_stats_html(stats: Dict[str, Any]) -> str:
+    """Build the KPI cards for closed positions."""
     if not stats:
-        return
+        return ""
         
     stats_html = f"""
     <div class="kpi-row">
@@ -95,47 +161,67 @@ def render_closed_stats(stats: Dict[str, Any]):
         </div>
     </div>
     """
-    st.markdown(stats_html, unsafe_allow_html=True)
+    return stats_html
+
+
+def render_closed_stats(stats: Dict[str, Any]):
+    """Render top statistics for closed positions."""
+    if not stats:
+        return
+    st.markdown(build_closed_stats_html(stats), unsafe_allow_html=True)
+
+
+def build_closed_table_html(curr_closed: List[Dict[str, Any]]) -> str:
+    """Build HTML table for the closed positions history."""
+    if not curr_closed:
+        return ""
+
+    body = "".join(
+        f'<tr><td>{i}</td>'
+        + _closed_row_cells(
+            c["ma_cp"], c["ngay_mua"], c["gia_von"], c.get("gia_von_2"),
+            c["ngay_ban"], c["gia_ban"], c["profit_pct"], c["loai"],
+        )
+        + '</tr>'
+        for i, c in enumerate(curr_closed, 1)
+    )
+    return _CLOSED_TABLE.format(body=body)
 
 
 def render_closed_table(curr_closed: List[Dict[str, Any]]):
     """Render HTML table for the closed positions history."""
     if not curr_closed:
         return
+    st.markdown(build_closed_table_html(curr_closed), unsafe_allow_html=True)
 
-    closed_rows_html = ""
-    for ci, c in enumerate(curr_closed):
-        ngay_mua = datetime.strptime(c["ngay_mua"], "%Y-%m-%d").strftime("%d/%m/%Y")
-        ngay_ban = datetime.strptime(c["ngay_ban"], "%Y-%m-%d").strftime("%d/%m/%Y")
-        
-        gia_von = c["gia_von"]
-        if c.get("gia_von_2"):
-            gia_von = (c["gia_von"] + c["gia_von_2"]) / 2
-            
-        gia_von_fmt = f"{gia_von:,.0f}".replace(",", ".")
-        gia_ban_fmt = f"{c['gia_ban']:,.0f}".replace(",", ".")
-        
-        p = c["profit_pct"]
-        if p >= 0:
-            p_cls = "profit-positive"
-            p_icon = "▲"
-            p_sign = "+"
-        else:
-            p_cls = "profit-negative"
-            p_icon = "▼"
-            p_sign = ""
-        profit_display = f'<span class="{p_cls}">{p_icon} {p_sign}{p:.2f}%</span>'
-        
-        loai_badge = '<span style="background:#2E7D32;color:#fff;padding:2px 8px;border-radius:8px;font-size:0.75rem;">Chốt lời</span>' if c["loai"] == "chot_loi" else '<span style="background:#C62828;color:#fff;padding:2px 8px;border-radius:8px;font-size:0.75rem;">Cắt lỗ</span>'
-
-        closed_rows_html += (f'<tr><td>{ci+1}</td><td class="symbol">{c["ma_cp"]}</td>'
-                             f'<td>{ngay_mua}</td><td>{gia_von_fmt}</td>'
-                             f'<td>{ngay_ban}</td><td>{gia_ban_fmt}</td>'
-                             f'<td>{profit_display}</td><td>{loai_badge}</td></tr>')
-
-    closed_table = ('<div class="glass-card"><table class="portfolio-table">'
-                    '<thead><tr><th>STT</th><th>Mã CP</th><th>Ngày mua</th>'
-                    '<th>Giá vốn</th><th>Ngày bán</th><th>Giá bán</th>'
-                    '<th>% Lợi nhuận</th><th>Loại</th></tr></thead>'
-                    f'<tbody>{closed_rows_html}</tbody></table></div>')
-    st.markdown(closed_table, unsafe_allow_html=True)
+
+def render_perf_panel(record: Dict[str, Any]):
+    """Render the admin-only sidebar panel with the timing trace of the last script run."""
+    counters = record["counters"]
+    with st.sidebar.expander("⏱️ Hiệu năng lần chạy gần nhất", expanded=True):
+        st.metric("Tổng thời gian", f"{record['total_ms']:.0f} ms")
+        st.caption(f"Ngoài các span (widget, layout, chưa đo): {record['unattributed_ms']:.0f} ms")
+        if record["spans"]:
+            st.dataframe(
+                [
+                    {"span": "· " * sp["depth"] + sp["name"], "ms": sp["ms"], "bắt đầu (ms)": sp["start_ms"], "luồng": sp["thread"]}
+                    for sp in sorted(record["spans"], key=lambda sp: sp["start_ms"])
+                ],
+                hide_index=True,
+                width="stretch",
+            )
+        cache_rows = []
+        for fn in ("get_market_price", "get_single_industry"):
+            calls = counters.get(f"{fn}.calls", 0)
+            miss = counters.get(f"{fn}.miss", 0)
+            cache_rows.append({
+                "hàm": fn,
+                "gọi": calls,
+                "hit bộ nhớ": max(0, calls - miss),
+                "hit đĩa": counters.get(f"{fn}.disk_hit", 0) + counters.get(f"{fn}.map_hit", 0),
+                "gọi vnstock": counters.get(f"{fn}.fetch", 0),
+            })
+        st.dataframe(cache_rows, hide_index=True, width="stretch")
+        other = {k: v for k, v in counters.items() if not k.startswith(("get_market_price.", "get_single_industry."))}
+        if other:
+            st.caption(" · ".join(f"{k}: {v}" for k, v in sorted(other.items())))
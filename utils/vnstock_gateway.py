@@ -0,0 +1,213 @@
+import os
+import random
+import re
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+from vnstock import Company, Listing, Quote, Trading
+
+# ============================================================
+# CỔNG GỌI VNSTOCK: LIVE / RECORD / REPLAY
+# ============================================================
+# Mọi lời gọi vnstock của app đi qua module này. Chế độ chọn bằng DMFM_VNSTOCK_MODE:
+#   live   (mặc định) gọi thẳng vnstock
+#   record gọi vnstock và lưu response vào thư mục fixture
+#   replay đọc response từ fixture, không cần mạng; có thể giả lập độ trễ, lỗi và
+#          DataFrame rỗng để đo retry / cache / lấy giá song song một cách lặp lại được
+#
+# Biến môi trường:
+#   DMFM_VNSTOCK_FIXTURES    thư mục fixture, mặc định fixtures/vnstock
+#   DMFM_VNSTOCK_LATENCY     phân phối độ trễ mỗi lời gọi (ms) khi replay:
+#                            "const:50", "uniform:20,200", "normal:80,20", "lognormal:4.0,0.5"
+#   DMFM_VNSTOCK_ERROR_RATE  tỷ lệ lời gọi raise ConnectionError khi replay (0..1)
+#   DMFM_VNSTOCK_EMPTY_RATE  tỷ lệ lời gọi trả DataFrame rỗng khi replay (0..1)
+#   DMFM_VNSTOCK_SEED        seed ngẫu nhiên để các lần replay giống hệt nhau
+#
+# Bố cục fixture (JSON, DataFrame dạng orient="split"):
+#   quote_history/<MÃ>.json, company_overview/<MÃ>.json
+#   price_board.json (gộp dòng của mọi mã đã ghi), symbols_by_industries.json
+
+MODES = ("live", "record", "replay")
+DEFAULT_FIXTURES_DIR = "fixtures/vnstock"
+
+
+class FixtureNotFoundError(LookupError):
+    """Replay nhưng chưa có fixture cho lời gọi này."""
+
+
+def _parse_latency(spec: str):
+    """'kind:a,b' -> hàm sinh độ trễ (giây) từ random.Random."""
+    if not spec:
+        return None
+    kind, _, params = spec.partition(":")
+    args = [float(x) for x in params.split(",") if x.strip()]
+    samplers = {
+        "const": lambda rng: args[0],
+        "uniform": lambda rng: rng.uniform(args[0], args[1]),
+        "normal": lambda rng: max(0.0, rng.gauss(args[0], args[1])),
+        "lognormal": lambda rng: rng.lognormvariate(args[0], args[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Phân phối độ trễ không hỗ trợ: {spec!r}")
+    sampler = samplers[kind]
+    return lambda rng: sampler(rng) / 1000
+
+
+class VnstockGateway:
+    """Gọi vnstock theo chế độ live / record / replay."""
+
+    def __init__(self, mode: str = "live", fixtures_dir: str = DEFAULT_FIXTURES_DIR,
+                 latency: str = "", error_rate: float = 0.0, empty_rate: float = 0.0, seed: int = None):
+        if mode not in MODES:
+            raise ValueError(f"DMFM_VNSTOCK_MODE phải là một trong {MODES}, nhận {mode!r}")
+        self.mode = mode
+        self.fixtures_dir = Path(fixtures_dir)
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.latency = latency
+        self._latency = _parse_latency(latency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "VnstockGateway":
+        seed = os.getenv("DMFM_VNSTOCK_SEED")
+        return cls(
+            mode=os.getenv("DMFM_VNSTOCK_MODE", "live"),
+            fixtures_dir=os.getenv("DMFM_VNSTOCK_FIXTURES", DEFAULT_FIXTURES_DIR),
+            latency=os.getenv("DMFM_VNSTOCK_LATENCY", ""),
+            error_rate=float(os.getenv("DMFM_VNSTOCK_ERROR_RATE", "0")),
+            empty_rate=float(os.getenv("DMFM_VNSTOCK_EMPTY_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+
+    # ---------- Fixture ----------
+    def _path(self, call: str, symbol: str = None) -> Path:
+        if symbol is None:
+            return self.fixtures_dir / f"{call}.json"
+        # Mã CP chỉ gồm chữ / số; bỏ ký tự lạ để không thoát khỏi thư mục fixture
+        return self.fixtures_dir / call / f"{re.sub(r'[^A-Za-z0-9_-]', '_', symbol)}.json"
+
+    def _save(self, path: Path, df: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = (df if df is not None else pd.DataFrame()).to_json(orient="split", date_format="iso", force_ascii=False)
+        path.write_text(text, encoding="utf-8")
+
+    def _load(self, path: Path) -> pd.DataFrame:
+        if not path.exists():
+            raise FixtureNotFoundError(f"Chưa có fixture {path}")
+        df = pd.read_json(StringIO(path.read_text(encoding="utf-8")), orient="split", convert_dates=False)
+        if "time" in df.columns:
+            df["time"] = pd.to_datetime(df["time"])
+        return df
+
+    def _replay_effects(self, call: str):
+        """Độ trễ / lỗi / rỗng giả lập cho 1 lời gọi replay. Trả về True nếu phải trả DataFrame rỗng."""
+        with self._lock:
+            delay = self._latency(self._rng) if self._latency else 0.0
+            fail = self._rng.random() < self.error_rate
+            empty = self._rng.random() < self.empty_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"Lỗi giả lập khi replay {call}")
+        return empty
+
+    def _call(self, call: str, symbol, live, replay_filter=None, merge=None) -> pd.DataFrame:
+        """Lời gọi theo mã (hoặc toàn thị trường nếu symbol None) với 1 fixture / mã.
+
+        merge(cũ, mới) dùng khi ghi để gộp response mới vào fixture đã có thay vì ghi đè.
+        """
+        path = self._path(call, symbol)
+        if self.mode == "live":
+            return live()
+        if self.mode == "record":
+            df = live()
+            with self._lock:
+                if merge and path.exists() and df is not None and not df.empty:
+                    self._save(path, merge(self._load(path), df))
+                else:
+                    self._save(path, df)
+            return df
+        if self._replay_effects(call):
+            return pd.DataFrame()
+        df = self._load(path)
+        return replay_filter(df) if replay_filter else df
+
+    # ---------- API dùng trong app ----------
+    def quote_history(self, symbol: str, start: str = None, end: str = None, interval: str = "1D", length=None) -> pd.DataFrame:
+        """Nến lịch sử (Quote.history), đơn vị nghìn VND."""
+        def live():
+            kwargs = {"interval": interval}
+            if start:
+                kwargs.update(start=start, end=end)
+            else:
+                kwargs["length"] = length
+            return Quote(symbol=symbol).history(**kwargs)
+
+        def replay_filter(df):
+            # Fixture chứa toàn bộ nến đã ghi; trả về phần nằm trong [start, end] như vnstock
+            if df.empty or "time" not in df.columns:
+                return df
+            if start:
+                df = df[df["time"] >= pd.Timestamp(start)]
+            if end:
+                df = df[df["time"] < pd.Timestamp(end) + pd.Timedelta(days=1)]
+            return df.reset_index(drop=True)
+
+        def merge(old, new):
+            # Lần cập nhật sau chỉ tải nến mới: nối vào nến đã ghi, nến trùng ngày lấy bản mới
+            merged = pd.concat([old, new], ignore_index=True)
+            return merged.drop_duplicates(subset="time", keep="last").sort_values("time").reset_index(drop=True)
+
+        return self._call("quote_history", symbol, live, replay_filter, merge)
+
+    def company_overview(self, symbol: str) -> pd.DataFrame:
+        """Thông tin doanh nghiệp (Company.overview) của 1 mã."""
+        return self._call("company_overview", symbol, lambda: Company(symbol=symbol, source="VCI").overview())
+
+    def symbols_by_industries(self) -> pd.DataFrame:
+        """Bảng phân ngành ICB toàn thị trường."""
+        return self._call("symbols_by_industries", None, lambda: Listing(source="VCI").symbols_by_industries())
+
+    def price_board(self, symbols) -> pd.DataFrame:
+        """Bảng giá nhiều mã (Trading.price_board), cột phẳng dạng listing_symbol, match_match_price..."""
+        symbols = list(symbols)
+
+        def live():
+            return Trading(source="VCI").price_board(symbols_list=symbols, flatten_columns=True, separator="_")
+
+        path = self._path("price_board")
+        if self.mode == "live":
+            return live()
+        if self.mode == "record":
+            df = live()
+            # Gộp vào fixture chung: mỗi mã giữ dòng mới nhất, để replay được mọi bộ mã đã gặp
+            if df is not None and not df.empty and "listing_symbol" in df.columns:
+                with self._lock:
+                    merged = df
+                    if path.exists():
+                        old = self._load(path)
+                        merged = pd.concat([old[~old["listing_symbol"].isin(df["listing_symbol"])], df], ignore_index=True)
+                    self._save(path, merged)
+            return df
+        if self._replay_effects("price_board"):
+            return pd.DataFrame()
+        df = self._load(path)
+        return df[df["listing_symbol"].isin(symbols)].reset_index(drop=True)
+
+    def describe(self) -> dict:
+        """Cấu hình hiện tại (để in kèm kết quả benchmark)."""
+        return {
+            "mode": self.mode,
+            "fixtures_dir": str(self.fixtures_dir),
+            "error_rate": self.error_rate,
+            "empty_rate": self.empty_rate,
+            "latency": self.latency,
+        }
+
+
+gateway = VnstockGateway.from_env()